@@ -3,7 +3,6 @@ import random
 import math
 import warnings
 from sys import maxsize
-import json
 
 
 """
@@ -15,8 +14,12 @@ Advanced strategy tips:
   - You can analyze action frames by modifying on_action_frame function
 
   - The GameState.map object can be manually manipulated to create hypothetical 
-  board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  board states. Though, we recommended making a copy with game_state.fork() to 
+  preserve the actual current map state. Forks are cheap to make.
+
+  - self.turn_budget tracks the time left in the turn. Propose a cheap plan early
+  with self.turn_budget.propose(game_state) and keep refining while
+  self.turn_budget.has_time(), the best plan is submitted if time runs out.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
@@ -25,6 +28,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         seed = random.randrange(maxsize)
         random.seed(seed)
         gamelib.debug_write('Random seed: {}'.format(seed))
+        # Set to True to precompute paths and threat maps for the next turn while the action phase plays out
+        self.speculative_planning = False
 
     def on_game_start(self, config):
         """ 
@@ -60,6 +65,9 @@ class AlgoStrategy(gamelib.AlgoCore):
         game engine.
         """
         game_state = gamelib.GameState(self.config, turn_state)
+        if self.speculation is not None:
+            # Reuse the threat maps computed in the background if the board is as predicted
+            self.speculation.apply(game_state)
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
         game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
 
@@ -123,12 +131,15 @@ class AlgoStrategy(gamelib.AlgoCore):
         # find available deploy locations on our edge
         friendly_edges = game_state.game_map.get_edge_locations(game_state.game_map.BOTTOM_LEFT) + game_state.game_map.get_edge_locations(game_state.game_map.BOTTOM_RIGHT)
         deploy_locations = self.filter_blocked_locations(friendly_edges, game_state)
+        # estimate every attack from every deploy location in one batched query
+        evaluator = gamelib.PathEvaluator(game_state)
+        estimates = evaluator.evaluate_many(deploy_locations, {SCOUT: max_scout_spawn, DEMOLISHER: max_demolisher_spawn, INTERCEPTOR: max_interceptor_spawn})
 
         # loop over all deploy locations and see how much gain we can get for each strategy: (damage to enemy units + score*12)
         for location in deploy_locations:
-            gain_location_scout = self.gain_of_attack(game_state, max_scout_spawn, SCOUT, location)
-            gain_location_demolisher = self.gain_of_attack(game_state, max_demolisher_spawn, DEMOLISHER, location)
-            gain_location_interceptor = self.gain_of_attack(game_state, max_interceptor_spawn, INTERCEPTOR, location)
+            gain_location_scout = self.gain_of_attack(estimates[(SCOUT, tuple(location))])
+            gain_location_demolisher = self.gain_of_attack(estimates[(DEMOLISHER, tuple(location))])
+            gain_location_interceptor = self.gain_of_attack(estimates[(INTERCEPTOR, tuple(location))])
             if gain_location_scout > scout_gain:
                 scout_deploy_location = location
                 scout_gain = gain_location_scout
@@ -164,39 +175,12 @@ class AlgoStrategy(gamelib.AlgoCore):
             game_state.attempt_spawn(DEMOLISHER, demolisher_deploy_location, max_demolisher_spawn)
             game_state.attempt_spawn(INTERCEPTOR, interceptor_deploy_locations[location_index], max_interceptor_spawn)
         
-    def gain_of_attack(self, game_state, number_units, unit_type, location):
+    def gain_of_attack(self, estimate):
         """
-        This function computes the weighted gain of a given type of attack starting at a specific location
+        This function computes the weighted gain of an attack from its gamelib.PathEstimate
         """
-        path = game_state.find_path_to_edge(location)
-        damage_dealt = 0
-        turret_damage = gamelib.GameUnit(TURRET, game_state.config).damage_i
-        unit_class = gamelib.GameUnit(unit_type, game_state.config)
-        unit_health = unit_class.health
-        unit_range = unit_class.attackRange
-        remaining_units = number_units
-        total_heath = unit_health * number_units
-        for path_location in path:
-            num_turrets = len(game_state.get_attackers(path_location, 0))
-            for frame_index in range(int(1/(unit_class.speed))):
-                total_damage = unit_class.damage_f * remaining_units
-                damage_dealt += min(total_damage, self.total_target_health(game_state, path_location, unit_class.attackRange))
-                total_heath -= num_turrets * turret_damage
-                remaining_units = (total_heath // unit_health) + 1
-            return (damage_dealt*weight_damage_enemy + remaining_units*weight_score)
-                                    
-                                    
-    def total_target_health(self, game_state, location, unit_range):
-        possible_locations = game_state.game_map.get_locations_in_range(location, unit_range)
-        total_health = 0
-        for location in possible_locations:
-            for enemy_unit in game_state.game_map[location]:
-                if enemy_unit.player_index == 0:
-                    continue
-                else:
-                    total_health += enemy_unit.health
-        return total_health
-            
+        return estimate.damage_dealt*weight_damage_enemy + estimate.survivors*weight_score
+
     def build_defences(self, game_state):
         """
         Build basic defenses using hardcoded locations.
@@ -276,13 +260,16 @@ class AlgoStrategy(gamelib.AlgoCore):
         estimate the path's damage risk.
         """
         damages = []
+        # Get all of the paths in one batched query
+        paths = game_state.find_paths_to_edges(location_options)
+        # Damage per frame from every enemy turret, stamped onto the map once
+        threat = game_state.threat_map(0)
         # Get the damage estimate each path will take
         for location in location_options:
-            path = game_state.find_path_to_edge(location)
+            path = paths[tuple(location)]
             damage = 0
             for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
+                damage += threat[path_location[0]][path_location[1]]
             damages.append(damage)
         
         # Now just return the location that takes the least damage
@@ -304,7 +291,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, action_frame):
         """
         This is the action frame of the game. This function could be called 
         hundreds of times per turn and could slow the algo down so avoid putting slow code here.
@@ -312,9 +299,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         Full doc on format of a game frame at: https://docs.c1games.com/json-docs.html
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        breaches = events["breach"]
+        # Only the breach events are decoded, the rest of the frame is skipped
+        breaches = action_frame.events("breach")
         for breach in breaches:
             location = breach[0]
             unit_owner_self = True if breach[4] == 1 else False
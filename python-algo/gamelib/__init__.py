@@ -7,6 +7,8 @@ It contains functions that let you get information about resources, deploy units
 The GameMap class in game_map.py represents the current game map. It can be used to access information related to the locations of units. 
 Investigating it is useful for any player that wants to access more information about the current state of the game. \n
 
+The TableGameMap class in table_map.py is an alternative GameMap that stores units in columns and only creates GameUnits when a tile is read. Pass map_class=TableGameMap to GameState to use it. \n
+
 The GameUnit class in unit.py represetns a single unit. 
 Investigating it is useful for any player that wants to access information about units. \n
 
@@ -16,14 +18,39 @@ Investigating it is useful for advanced players interested in getting data from
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
-util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
+The PathEvaluator class in evaluation.py estimates how a group of mobile units fares walking a path, using the threat map from GameState. \n
+
+The Simulator class in simulator.py plays out an action phase offline, predicting breaches and the damage each side deals. \n
+
+The ActionFrame class in action_frame.py is passed to on_action_frame. It decodes only the sections and events of a frame that are used. \n
+
+The MessageReader class in reader.py reads messages from the engine on a background thread, merging action frames that pile up while the algo is busy. \n
+
+The WorkerPool class in parallel.py runs evaluation functions on worker processes, which read the board from shared memory instead of receiving a pickled GameState. \n
+
+The TurnBudget class in scheduler.py keeps each turn within the time limit. AlgoCore makes one per turn, available as self.turn_budget in on_turn, and submits the best proposed plan if on_turn runs out of time. \n
+
+The SpeculativePlanner class in speculation.py predicts the board of the next turn during the action phase and plans on it in the background. AlgoCore runs it when speculative_planning is True. \n
+
+replay.py checks a simulator against the action phases recorded in a replay file, reporting its accuracy and speed. \n
+
+geometry.py contains precomputed tables describing the shape of the arena, such as the bounds mask, edges and tile neighbors. \n
+
+util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write(),
+and EngineMessage, which parses each message from the engine once, with orjson or ujson when they are installed.
+Its logging functions, debug(), info(), warn() and error(), buffer messages and only format and write them when flush_log() is called, which AlgoCore does after every turn.
 """
 
 from .algocore import AlgoCore
-from .util import debug_write
+from .action_frame import ActionFrame
+from .util import debug_write, EngineMessage, parse_message
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
+from .scheduler import TurnBudget
+from .parallel import WorkerPool
+from .evaluation import PathEvaluator, PathEstimate
+from .simulator import Simulator, SimulationResult
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["action_frame", "algocore", "evaluation", "game_state", "game_map", "geometry", "navigation", "parallel", "reader", "replay", "scheduler", "simulator", "speculation", "table_map", "unit", "util"]
  
\ No newline at end of file
@@ -0,0 +1,157 @@
+import json
+import re
+
+from .util import EngineMessage, json_loads
+
+"""
+Lazy views of the action frames the engine sends during the action phase.
+
+The engine sends many frames per turn, and most handlers only look at a few events, such as
+breaches or deaths. An ActionFrame finds the sections of the frame it is asked for in the raw
+line and decodes only those, caching them, so the unit lists are never decoded unless they are used.
+"""
+
+_decoder = json.JSONDecoder()
+_key_patterns = {}
+
+
+def _key_pattern(key):
+    pattern = _key_patterns.get(key)
+    if pattern is None:
+        # A quoted string followed by a colon can only be an object key, never a value
+        pattern = re.compile(r'"{}"\s*:\s*'.format(re.escape(key)))
+        _key_patterns[key] = pattern
+    return pattern
+
+
+class ActionFrame(EngineMessage):
+    """One action frame, decoded a section at a time.
+
+    It is still the original string, and parses the whole frame into data if that is used,
+    so handlers written for a plain string or an EngineMessage keep working.
+
+    Attributes :
+        * turn_info (list): The turn info of the frame, [message type, turn number, frame number]
+        * p1_units, p2_units (list): Each player's units, one list per unit type
+        * p1_stats, p2_stats (list): Each player's health, SP, MP and time
+        * coalesced (int): How many earlier frames were merged into this one, see merge
+
+    """
+    __slots__ = ("_sections", "_events_start", "_data", "coalesced")
+
+    def __new__(cls, line):
+        frame = str.__new__(cls, line)
+        frame._sections = {}
+        frame._events_start = None
+        frame._data = None
+        frame.coalesced = 0
+        return frame
+
+    @property
+    def data(self):
+        if self._data is None:
+            # Some parsers, like orjson, only accept an exact str
+            self._data = json_loads(str(self))
+        return self._data
+
+    def merge(self, earlier):
+        """Merges an earlier frame into this one, for when frames arrive faster than they are handled
+
+        The merged frame keeps this frame's units and stats, which are the most recent, and its events
+        become the events of both frames, earlier ones first, so events such as breaches are never lost.
+        The events are written back into the frame's text, so json.loads of the merged frame sees them too.
+
+        Args:
+            earlier: The ActionFrame that came before this one
+
+        Returns:
+            A new ActionFrame holding both frames
+
+        """
+        match = _key_pattern("events").search(self)
+        if match is None:
+            raise ValueError("The frame has no events")
+        events, end = _decoder.raw_decode(self, match.end())
+        earlier_events = earlier.section("events") or {}
+        merged = {}
+        for kind in list(earlier_events) + [kind for kind in events if kind not in earlier_events]:
+            merged[kind] = earlier_events.get(kind, []) + events.get(kind, [])
+        frame = ActionFrame(self[:match.end()] + json.dumps(merged, separators=(",", ":")) + self[end:])
+        # Only the events changed, so the other sections already decoded stay valid
+        frame._sections = {key: value for key, value in self._sections.items() if not isinstance(key, tuple)}
+        frame._sections["events"] = merged
+        frame.coalesced = self.coalesced + earlier.coalesced + 1
+        return frame
+
+    def _decode(self, key, start=0):
+        """Decodes the value of the first key named key after start, or returns None if there is none
+        """
+        match = _key_pattern(key).search(self, start)
+        if match is None:
+            return None
+        return _decoder.raw_decode(self, match.end())[0]
+
+    def section(self, key):
+        """Gets one top level section of the frame, decoding it the first time it is asked for
+
+        Args:
+            key: The name of the section, as in the engine's json, for example "p1Units"
+
+        Returns:
+            The decoded section, or None if the frame does not have it
+
+        """
+        sections = self._sections
+        if key in sections:
+            return sections[key]
+        if self._data is not None:
+            value = self._data.get(key)
+        else:
+            value = self._decode(key)
+        sections[key] = value
+        return value
+
+    def events(self, kind):
+        """Gets the events of one kind that happened this frame, decoding only those
+
+        Args:
+            kind: The kind of event, such as "breach", "damage", "death", "spawn", "move" or "attack"
+
+        Returns:
+            A list of the events of that kind, empty if there were none
+
+        """
+        sections = self._sections
+        key = ("events", kind)
+        if key in sections:
+            return sections[key]
+        if self._data is not None or "events" in sections:
+            value = (self.section("events") or {}).get(kind)
+        else:
+            if self._events_start is None:
+                match = _key_pattern("events").search(self)
+                self._events_start = match.end() if match is not None else len(self)
+            value = self._decode(kind, self._events_start)
+        value = value if value is not None else []
+        sections[key] = value
+        return value
+
+    @property
+    def turn_info(self):
+        return self.section("turnInfo")
+
+    @property
+    def p1_units(self):
+        return self.section("p1Units")
+
+    @property
+    def p2_units(self):
+        return self.section("p2Units")
+
+    @property
+    def p1_stats(self):
+        return self.section("p1Stats")
+
+    @property
+    def p2_stats(self):
+        return self.section("p2Stats")
@@ -1,7 +1,11 @@
-import json
-
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+import sys
+
+from .util import get_command, debug_write, BANNER_TEXT, send_command, EngineMessage, parse_message, warn, flush_log
+from .action_frame import ActionFrame
+from .reader import MessageReader, read_message
+from .scheduler import TurnBudget, turn_time_limit
+from .speculation import SpeculativePlanner
 
 class AlgoCore(object):
     """
@@ -10,10 +14,27 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * turn_time_limit (float): Seconds allowed per turn, None to read the limit from the config
+        * turn_safety_margin (float): How many seconds before the limit a turn is submitted, at the latest
+        * turn_budget (TurnBudget): The budget of the turn being played, None outside of on_turn
+        * speculative_planning (bool): Whether to plan the next turn in the background during the action phase, see plan_next_turn
+        * speculation_wait (float): How many seconds a turn waits for background planning that is still in progress
+        * speculation (Speculation): The validated background plan for the turn being played, or None
+        * threaded_input (bool): Whether to read messages from the engine on a background thread, see MessageReader
+        * max_pending_frames (int): How many action frames may wait to be handled before the oldest are merged, or dropped if they cannot be
 
     """
     def __init__(self):
         self.config = None
+        self.turn_time_limit = None
+        self.turn_safety_margin = 1.0
+        self.turn_budget = None
+        self.speculative_planning = False
+        self.speculation_wait = 0.2
+        self.speculation = None
+        self._planner = None
+        self.threaded_input = True
+        self.max_pending_frames = 8
 
     def on_game_start(self, config):
         """
@@ -26,13 +47,17 @@ class AlgoCore(object):
     def on_turn(self, game_state):
         """
         This step function is called at the start of each turn.
-        It is passed the current game state, which can be used to initiate a new GameState object. 
+        It is passed the current game state as an EngineMessage, which can be used to initiate a new GameState object
+        without parsing it again, and whose submit_turn goes through the turn's budget. self.turn_budget tracks the time left in the turn, see TurnBudget. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
         """
-        send_command("[]")
-        send_command("[]")
+        if self.turn_budget is not None:
+            self.turn_budget.submit("[]", "[]")
+        else:
+            send_command("[]")
+            send_command("[]")
     
     def on_action_frame(self, action_frame_game_state):
         """
@@ -40,9 +65,45 @@ class AlgoCore(object):
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
         They can be handled in this function. 
+        Each frame is passed as an ActionFrame, which only decodes the parts of the frame that are used,
+        for example action_frame_game_state.events("breach")
         """
         pass
 
+    def plan_next_turn(self, game_state):
+        """
+        Called in a background thread during the action phase when speculative_planning is True.
+        It is passed a GameState of the board the next turn is predicted to start on, with its paths,
+        threat and shield maps already computed, and can return a plan for that turn. \n
+        In on_turn, self.speculation holds the plan, and tells whether the real board and resources match
+        the prediction. self.speculation.apply(game_state) reuses the predicted maps in the real GameState.
+        This runs alongside on_action_frame, so it should not change the algo's own attributes.
+        """
+        return None
+
+    def _play_turn(self, message):
+        """Runs on_turn within the turn's time budget, and makes sure exactly one turn is submitted
+        """
+        limit = self.turn_time_limit if self.turn_time_limit is not None else turn_time_limit(self.config)
+        budget = TurnBudget(limit, self.turn_safety_margin)
+        self.turn_budget = budget
+        # GameStates made from the message submit through the budget of this turn
+        message = EngineMessage(message, parse_message(message), budget)
+        budget.start_watchdog()
+        try:
+            if self._planner is not None:
+                self.speculation = self._planner.finish(parse_message(message), min(self.speculation_wait, budget.remaining()))
+            self.on_turn(message)
+        finally:
+            budget.stop_watchdog()
+            self.turn_budget = None
+            self.speculation = None
+            if not budget.submitted:
+                warn("on_turn did not submit a turn, submitting the best plan found")
+                budget.submit_best()
+            # Write out the turn's log once the turn is sent, so logging does not cost turn time,
+            # and before the next message is awaited, so nothing is lost if the engine stops the algo
+            flush_log()
 
     def start(self):
         """ 
@@ -52,44 +113,73 @@ class AlgoCore(object):
         The algo continues this loop until it recieves the "End" turn message from the game.
         """
         debug_write(BANNER_TEXT)
+        flush_log()
 
+        reader = MessageReader(sys.stdin, self.max_pending_frames) if self.threaded_input else None
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
-            if "replaySave" in game_state_string:
+            if reader is not None:
+                message = reader.get()
+                if message is None:
+                    # Game parent process terminated so exit
+                    debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+                    flush_log()
+                    exit()
+            else:
+                message = read_message(get_command())
+            game_state_string = message
+            if isinstance(message, ActionFrame):
+                """
+                If stateType == 1, this game_state_string string represents a single frame of an action phase
+                """
+                if self.speculative_planning:
+                    if self._planner is None:
+                        self._planner = SpeculativePlanner(self.config, self.plan_next_turn)
+                    self._planner.observe(message)
+                self.on_action_frame(message)
+                # The engine can stop the algo at any point of the action phase, so do not keep the frame's log waiting
+                flush_log()
+                continue
+            if not isinstance(message, EngineMessage):
+                warn("Got unexpected string : {}", game_state_string)
+                continue
+            state = message.data
+            if not isinstance(state, dict):
+                """
+                Something is wrong? Received an incorrect or improperly formatted string.
+                """
+                warn("Got unexpected string : {}", game_state_string)
+            elif "unitInformation" in state:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
-                self.on_game_start(parsed_config)
-            elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
+                self.on_game_start(state)
+                flush_log()
+            elif "turnInfo" in state:
                 stateType = int(state.get("turnInfo")[0])
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
-                    """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
-                    """
-                    self.on_action_frame(game_state_string)
+                    self._play_turn(message)
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
                     debug_write("Got end state, game over. Stopping algo.")
+                    flush_log()
+                    if self._planner is not None:
+                        self._planner.close()
                     break
                 else:
                     """
                     Something is wrong? Received an incorrect or improperly formatted string.
                     """
-                    debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+                    warn("Got unexpected string with turnInfo: {}", game_state_string)
             else:
                 """
                 Something is wrong? Received an incorrect or improperly formatted string.
                 """
-                debug_write("Got unexpected string : {}".format(game_state_string))
+                warn("Got unexpected string : {}", game_state_string)
@@ -0,0 +1,163 @@
+import math
+from collections import namedtuple
+
+from .unit import unit_stats
+from .geometry import ARENA_SIZE, tiles_in_range
+
+"""
+An estimate of how a group of mobile units fares walking a path.
+
+    * damage_taken (float): Total damage the group absorbs from enemy structures, shields included
+    * survivors (int): How many units of the group are still alive at the end of the path
+    * damage_dealt (float): Total damage the group deals to enemy structures on the way
+    * frames (int): How many frames the group spends walking the path
+"""
+PathEstimate = namedtuple("PathEstimate", ["damage_taken", "survivors", "damage_dealt", "frames"])
+
+
+def _flatten(per_tile):
+    """Turns a per tile array from GameState into a flat list indexed by x * ARENA_SIZE + y
+    """
+    if hasattr(per_tile, "ravel"):
+        return per_tile.ravel().tolist()
+    flat = []
+    for column in per_tile:
+        flat.extend(column)
+    return flat
+
+
+class PathEvaluator:
+    """Scores paths against the current board using the threat map and the coverage of friendly supports.
+
+    The board is summarised once, when the evaluator is created, into flat per tile tables: the damage
+    per frame enemy structures deal to each tile, the supports covering each tile and, per attack range,
+    the enemy structure health a unit on each tile can reach. Scoring a path is then a walk over those
+    tables, so one evaluator can score every deploy location for every mobile unit type cheaply.
+    Create a new evaluator after changing the board.
+
+    The estimate treats the group as one pool of health. Each frame, enemy structures deal their damage
+    to the pool, and every surviving unit deals its structure damage to the structures in range, capped by
+    their total health. Structures are not removed as they take damage, so the estimate is optimistic for
+    long paths through heavy defences.
+
+    Attributes :
+        * game_state (GameState): The state the evaluator was built from
+        * player_index (int): The player whose units are being evaluated, 0 for you 1 for the enemy
+
+    """
+    def __init__(self, game_state, player_index=0):
+        """Summarises the board for the given attacking player
+
+        Args:
+            game_state: The GameState to evaluate paths on
+            player_index: The player whose units are being evaluated, 0 for you 1 for the enemy
+
+        """
+        self.game_state = game_state
+        self.player_index = player_index
+        self._threat = _flatten(game_state.threat_map(player_index))
+        self._supports = self._build_supports()
+        self._target_health = {}
+
+    def _build_supports(self):
+        """Lists, per tile, the (support id, shield) pairs of friendly supports covering it
+        """
+        game_map = self.game_state.game_map
+        supports = [()] * (ARENA_SIZE * ARENA_SIZE)
+        for unit in game_map._structure_units():
+            if unit.player_index != self.player_index or unit.shieldRange <= 0:
+                continue
+            rows = unit.y if self.player_index == 0 else ARENA_SIZE - 1 - unit.y
+            shield = unit.shieldPerUnit + unit.shieldBonusPerY * rows
+            if shield <= 0:
+                continue
+            for index in tiles_in_range(unit.x, unit.y, unit.shieldRange, game_map._hit_radius):
+                supports[index] = supports[index] + ((id(unit), shield),)
+        return supports
+
+    def _get_target_health(self, attack_range):
+        """Gets the enemy structure health within attack_range of each tile, as a flat list
+        """
+        target_health = self._target_health.get(attack_range)
+        if target_health is None:
+            game_map = self.game_state.game_map
+            stamps = []
+            for unit in game_map._structure_units():
+                if unit.player_index != self.player_index:
+                    stamps.append((tiles_in_range(unit.x, unit.y, attack_range, game_map._hit_radius), unit.health))
+            target_health = _flatten(self.game_state._stamp(stamps))
+            self._target_health[attack_range] = target_health
+        return target_health
+
+    def evaluate(self, path, unit_type, count=1):
+        """Estimates how a group of units fares walking a path
+
+        Args:
+            path: A path as returned by find_path_to_edge, starting at the deploy location
+            unit_type: The type of mobile unit deployed
+            count: How many units are deployed together
+
+        Returns:
+            A PathEstimate
+
+        """
+        unit = unit_stats(unit_type, self.game_state.config)
+        if not path or count <= 0:
+            return PathEstimate(0, max(count, 0), 0, 0)
+        if unit.stationary or unit.speed <= 0:
+            self.game_state.warn("Can only evaluate paths for mobile units, got {}", unit_type)
+            return PathEstimate(0, count, 0, 0)
+
+        threat = self._threat
+        supports = self._supports
+        target_health = self._get_target_health(unit.attackRange) if unit.damage_f > 0 else None
+        frames_per_tile = 1 / unit.speed
+        unit_health = unit.max_health
+        pool = unit_health * count
+        survivors = count
+        shielded_by = set()
+        damage_taken = 0
+        damage_dealt = 0
+        frames = 0
+        # The unit leaves the board, or self destructs, as soon as it reaches the last tile
+        for step in range(len(path) - 1):
+            x, y = path[step]
+            index = x * ARENA_SIZE + y
+            for support, shield in supports[index]:
+                if support not in shielded_by:
+                    shielded_by.add(support)
+                    unit_health += shield
+                    pool += shield * survivors
+            # Moves happen every 1/speed frames, so fractional speeds spread frames unevenly over tiles
+            tile_frames = int((step + 1) * frames_per_tile + 1e-9) - int(step * frames_per_tile + 1e-9)
+            frames += tile_frames
+            if target_health is not None and target_health[index] > 0:
+                damage_dealt += min(unit.damage_f * survivors, target_health[index]) * tile_frames
+            if threat[index] > 0:
+                taken = min(threat[index] * tile_frames, pool)
+                damage_taken += taken
+                pool -= taken
+                survivors = math.ceil(pool / unit_health - 1e-9) if pool > 0 else 0
+                if survivors == 0:
+                    break
+        return PathEstimate(damage_taken, survivors, damage_dealt, frames)
+
+    def evaluate_many(self, start_locations, units):
+        """Estimates every combination of deploy location and unit group, pathing each location once
+
+        Args:
+            start_locations: A list of deploy locations
+            units: A dict mapping each mobile unit type to evaluate to how many of it are deployed
+
+        Returns:
+            A dict mapping (unit_type, (x, y)) to a PathEstimate, or None if the location is blocked
+
+        """
+        paths = self.game_state.find_paths_to_edges(start_locations)
+        estimates = {}
+        for location in start_locations:
+            key = tuple(location)
+            path = paths[key]
+            for unit_type, count in units.items():
+                estimates[(unit_type, key)] = self.evaluate(path, unit_type, count) if path is not None else None
+        return estimates
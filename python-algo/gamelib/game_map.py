@@ -1,6 +1,19 @@
+import copy
+import itertools
 import math
+import random
 from .unit import GameUnit
-from .util import debug_write
+from .util import warn
+from .geometry import ARENA_LOCATIONS, BOUNDS_MASK, EDGES, TILE_LOCATIONS, in_arena_bounds, range_stencil, tiles_in_range
+
+# One random 64 bit key per tile. The layout hash of a map is the xor of the keys of every
+# tile holding a structure. The seed is fixed so hashes agree between processes.
+_zobrist_random = random.Random(2803)
+_ZOBRIST_KEYS = tuple(_zobrist_random.getrandbits(64) for _ in range(28 * 28))
+
+# Every change to any map gets a new revision number, so values derived from a map can be
+# cached alongside the revision they were computed from
+_revisions = itertools.count(1)
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -9,6 +22,18 @@ class GameMap:
     game_map[x, y] will return a list of Units located at that location, 
     or an empty list if there are no units at the location
 
+    The map also keeps a flat occupancy bitmap, indexed by x * ARENA_SIZE + y, that records
+    which tiles hold a structure and which hold any unit at all. It is updated by add_unit,
+    remove_unit and game_map[x, y] = units, so pathfinding and spawn checks never need to
+    rescan the board. Appending to the list returned by game_map[x, y] directly bypasses it.
+    Alongside the bitmap the map keeps a Zobrist hash of its structure layout, see layout_hash,
+    and a revision number that changes whenever the map does.
+
+    Maps can be forked cheaply, see fork. Forks share columns of tiles until one of them writes to
+    a column, so GameMap never changes a tile's list of units in place, it always replaces it. Once a
+    map has been forked, game_map[x, y] gives the caller a copy of a shared tile and its units, so
+    changing them directly only affects that map.
+
     Attributes :
         * config (JSON): Contains information about the current game rules
         * enable_warnings (bool): If true, debug messages for game_map functions will print out
@@ -35,48 +60,245 @@ class GameMap:
         self.TOP_LEFT = 1
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
-        self.__map = self.__empty_grid()
-        self.__start = [13,0]
+        self._init_storage()
+        # While a GameState savepoint is active, the old contents of every tile written to are recorded here
+        self._undo_log = None
+        self.__position = 0
+        self._structures = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        self._occupied = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        self._layout_hash = 0
+        self._revision = next(_revisions)
+        # A unit with a given range affects all locations who's centers are within that range + get hit radius
+        self._hit_radius = config["unitInformation"][0].get('getHitRadius', 0)
+        for unit_information in config["unitInformation"]:
+            for stats in (unit_information, unit_information.get("upgrade", {})):
+                for key in ("attackRange", "shieldRange", "selfDestructRange"):
+                    if key in stats:
+                        range_stencil(stats[key], self._hit_radius)
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
-            return self.__map[x][y]
+            return self._read_tile(x, y)
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
-            self.__map[location[0]][location[1]] = val
+            x, y = location
+            self._set_tile(x, y, val)
+            self._refresh_tile(x, y)
             return
         self._invalid_coordinates(location)
 
+    def _refresh_tile(self, x, y):
+        """Recomputes the occupancy bitmap for a single tile from the units on it
+        """
+        index = x * self.ARENA_SIZE + y
+        units = self._units_at(x, y)
+        self._occupied[index] = 1 if units else 0
+        self._set_structure(index, any(unit.stationary for unit in units))
+        self._mark_changed()
+
+    """
+    Storage. The grid is one list of units per tile, in columns that forks share until written to.
+    Everything else in GameMap goes through the methods below, so another storage engine only has to
+    provide them, see TableGameMap. A tile's state is whatever the engine stores for a tile, and is
+    never changed in place, so old states can be kept for rollback.
+    """
+    def _init_storage(self):
+        self.__map = self.__empty_grid()
+        # Columns of the grid that may be shared with a fork are copied before they are written to
+        self._owned_columns = [True] * self.ARENA_SIZE
+        # Once forked, which tiles hold a list and units that no other map shares. None if never forked
+        self._private_tiles = None
+
+    def _units_at(self, x, y):
+        """Gets the list of GameUnits on a tile
+        """
+        return self.__map[x][y]
+
+    def _read_tile(self, x, y):
+        """Gets the list of GameUnits on a tile for game_map[x, y], which the caller may change in place.
+        Only used for game_map[x, y], read only queries inside gamelib use _units_at and never copy
+        """
+        private_tiles = self._private_tiles
+        index = x * self.ARENA_SIZE + y
+        if private_tiles is None or private_tiles[index]:
+            return self.__map[x][y]
+        units = [copy.copy(unit) for unit in self.__map[x][y]]
+        # The copy holds the same units, so this is not a change to record or to invalidate caches for
+        self._writable_column(x)[y] = units
+        private_tiles[index] = 1
+        return units
+
+    def _tile_state(self, x, y):
+        return self.__map[x][y]
+
+    def _load_tile(self, x, y, state):
+        self._writable_column(x)[y] = state
+        if self._private_tiles is not None:
+            # New lists are built from the old ones, so their units may still be shared
+            self._private_tiles[x * self.ARENA_SIZE + y] = 0
+
+    def _pack(self, units):
+        """Turns a list of GameUnits into a tile state
+        """
+        return units
+
+    def _fork_storage(self, child):
+        child.__map = list(self.__map)
+        self._owned_columns = [False] * self.ARENA_SIZE
+        child._owned_columns = [False] * self.ARENA_SIZE
+        self._private_tiles = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        child._private_tiles = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+
+    def _add_parsed_unit(self, unit_type, player_index, health, x, y):
+        """Adds a unit read from the serialized game state
+        """
+        self._place_unit(GameUnit(unit_type, self.config, player_index, health, x, y))
+
+    def _writable_column(self, x):
+        """Gets column x of the grid, copying it first if it may be shared with a fork
+        """
+        if not self._owned_columns[x]:
+            self.__map[x] = list(self.__map[x])
+            self._owned_columns[x] = True
+        return self.__map[x]
+
+    def _set_tile(self, x, y, units):
+        """Replaces the list of units on a tile
+        """
+        self._set_tile_state(x, y, self._pack(units))
+
+    def _set_tile_state(self, x, y, state):
+        """Replaces the state of a tile, recording the old state if a savepoint is active
+        """
+        if self._undo_log is not None:
+            index = x * self.ARENA_SIZE + y
+            self._undo_log.append((self._restore_tile, x, y, self._tile_state(x, y), self._structures[index],
+                                   self._occupied[index], self._layout_hash, self._revision))
+        self._load_tile(x, y, state)
+
+    def _restore_tile(self, x, y, state, structure, occupied, layout_hash, revision):
+        """Undoes a _set_tile_state, used by GameState.rollback
+        """
+        index = x * self.ARENA_SIZE + y
+        self._load_tile(x, y, state)
+        self._structures[index] = structure
+        self._occupied[index] = occupied
+        self._layout_hash = layout_hash
+        self._revision = revision
+
+    def fork(self):
+        """Makes a copy of the map that can be changed without affecting this one, and the other way around.
+
+        Forking only copies the occupancy bitmaps and the outer list of columns. Columns of tiles, and the
+        units on them, are shared until one of the maps writes to them, or hands them out with game_map[x, y]
+        and they are copied. Other storage engines copy their own storage, see _fork_storage.
+
+        Returns:
+            A new GameMap
+
+        """
+        child = copy.copy(self)
+        child._structures = bytearray(self._structures)
+        child._occupied = bytearray(self._occupied)
+        child._undo_log = None
+        self._fork_storage(child)
+        return child
+
+    def _mark_changed(self):
+        """Gives the map a new revision, invalidating anything cached from the old one.
+        Called for every change made through GameMap, and by GameState when it upgrades a unit in place.
+        """
+        self._revision = next(_revisions)
+
+    def _set_structure(self, index, present):
+        """Marks whether the tile at index holds a structure, updating the layout hash if that changed
+        """
+        if self._structures[index] != present:
+            self._structures[index] = present
+            self._layout_hash ^= _ZOBRIST_KEYS[index]
+
+    def _place_unit(self, unit):
+        """Puts an existing GameUnit on the map at its own location, keeping the occupancy bitmap in sync.
+        Structures replace whatever was on the tile, mobile units stack.
+        """
+        x, y = unit.x, unit.y
+        index = x * self.ARENA_SIZE + y
+        if unit.stationary:
+            self._set_tile(x, y, [unit])
+            self._set_structure(index, 1)
+        else:
+            self._set_tile(x, y, self._units_at(x, y) + [unit])
+        self._occupied[index] = 1
+        self._mark_changed()
+
+    def _place_units(self, unit_type, location, count, player_index=0):
+        """Puts count new units of one type on a single tile, replacing the tile's list once rather than once per unit
+        """
+        x, y = location
+        units = [GameUnit(unit_type, self.config, player_index, None, x, y) for _ in range(count)]
+        if units[0].stationary:
+            self._place_unit(units[-1])
+            return
+        index = x * self.ARENA_SIZE + y
+        self._set_tile(x, y, self._units_at(x, y) + units)
+        self._occupied[index] = 1
+        self._mark_changed()
+
+    def _upgrade_structure(self, x, y):
+        """Upgrades the structure at [x, y]. It is upgraded on a copy, as forks of this map may share the unit
+        """
+        units = []
+        for unit in self._units_at(x, y):
+            if unit.stationary:
+                unit = copy.copy(unit)
+                unit.upgrade()
+            units.append(unit)
+        self._set_tile(x, y, units)
+        self._mark_changed()
+
+    def _is_blocked(self, x, y):
+        """True if there is a structure at [x, y]. Expects a location inside the arena.
+        """
+        return self._structures[x * self.ARENA_SIZE + y] == 1
+
+    def _structure_units(self):
+        """Yields every structure on the map, using the bitmap to skip empty tiles
+        """
+        for index, present in enumerate(self._structures):
+            if present:
+                x, y = divmod(index, self.ARENA_SIZE)
+                for unit in self._units_at(x, y):
+                    if unit.stationary:
+                        yield unit
+
+    def layout_hash(self):
+        """A hash of which tiles hold structures. Maps with the same structure layout have the same
+        hash, so it can be used as a cache key for anything that only depends on where units can path.
+
+        Returns:
+            A 64 bit integer
+        """
+        return self._layout_hash
+
     def __iter__(self):
-        self.__start = [13,0]
+        self.__position = 0
         return self
     
     def __next__(self):
-        location = self.__start
-        if location == [15,27]:
+        if self.__position >= len(ARENA_LOCATIONS):
             raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
+        location = ARENA_LOCATIONS[self.__position]
+        self.__position += 1
+        return list(location)
 
     def __empty_grid(self):
-        grid = []
-        for x in range(0, self.ARENA_SIZE):
-            grid.append([])
-            for _ in range(0, self.ARENA_SIZE):
-                grid[x].append([])
-        return grid
+        return [[[] for _ in range(self.ARENA_SIZE)] for _ in range(self.ARENA_SIZE)]
 
     def _invalid_coordinates(self, location):
-        self.warn("{} is out of bounds.".format(str(location)))
+        self.warn("{} is out of bounds.", location)
 
     def in_arena_bounds(self, location):
         """Checks if the given location is inside the diamond shaped game board.
@@ -89,19 +311,9 @@ class GameMap:
         
         """
         x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        if type(x) is int and type(y) is int:
+            return 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE and BOUNDS_MASK[x * self.ARENA_SIZE + y] == 1
+        return in_arena_bounds(x, y)
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -114,11 +326,10 @@ class GameMap:
 
         """
         if not quadrant_description in [self.TOP_LEFT, self.TOP_RIGHT, self.BOTTOM_LEFT, self.BOTTOM_RIGHT]:
-            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
+            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.", quadrant_description)
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [list(location) for location in EDGES[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +338,7 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[list(location) for location in edge] for edge in EDGES]
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -164,14 +355,10 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
         if player_index < 0 or player_index > 1:
-            self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
+            self.warn("Player index {} is invalid. Player index should be 0 or 1.", player_index)
 
-        x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
-        if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
-        else:
-            self.__map[x][y] = [new_unit]
+        self._place_unit(new_unit)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -186,7 +373,10 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
-        self.__map[x][y] = []
+        self._set_tile(x, y, [])
+        self._set_structure(x * self.ARENA_SIZE + y, 0)
+        self._occupied[x * self.ARENA_SIZE + y] = 0
+        self._mark_changed()
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -200,19 +390,20 @@ class GameMap:
 
         """
         if radius < 0 or radius > self.ARENA_SIZE:
-            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}".format(radius, self.ARENA_SIZE))
+            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}", radius, self.ARENA_SIZE)
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
         x, y = location
+        if type(x) is int and type(y) is int:
+            return [list(TILE_LOCATIONS[index]) for index in tiles_in_range(x, y, radius, self._hit_radius)]
+
         locations = []
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
                 new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
+                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + self._hit_radius:
                     locations.append(new_location)
         return locations
 
@@ -232,9 +423,10 @@ class GameMap:
 
         return math.sqrt((x1 - x2)**2 + (y1 - y2)**2)
 
-    def warn(self, message):
+    def warn(self, message, *args):
         """
-        Used internally by game_map to print out default messaging
+        Used internally by game_map to print out default messaging.
+        The message is formatted with args only if it is written out, see util.log
         """
         if(self.enable_warnings):
-            debug_write(message)
+            warn(message, *args)
@@ -1,11 +1,18 @@
+import copy
 import math
 import json
 import sys
 
 from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .util import send_command, parse_message, warn
 from .unit import GameUnit
 from .game_map import GameMap
+from .geometry import ARENA_SIZE, FRIENDLY_EDGE_TILES, TILE_COUNT, tiles_in_range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def is_stationary(unit_type):
     """
@@ -17,6 +24,26 @@ def is_stationary(unit_type):
     """
     return unit_type in STRUCTURE_TYPES
 
+# The config the unit type globals below were last read from
+_bound_config = None
+
+def _bind_unit_types(config):
+    """Sets the module's unit type globals from a game config.
+
+    The globals are only rebound when the config changes, and every one of them is built before any is
+    bound, so GameStates made on background threads never leave another thread a half filled table.
+    """
+    global WALL, FACTORY, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX, _bound_config
+    if config is _bound_config:
+        return
+    shorthands = [unit_information["shorthand"] for unit_information in config["unitInformation"][:8]]
+    unit_type_to_index = {shorthand: index for index, shorthand in enumerate(shorthands)}
+    WALL, FACTORY, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE = shorthands
+    ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, FACTORY, TURRET]
+    STRUCTURE_TYPES = [WALL, FACTORY, TURRET]
+    UNIT_TYPE_TO_INDEX = unit_type_to_index
+    _bound_config = config
+
 class GameState:
     """Represents the entire gamestate for a given turn
     Provides methods related to resources and unit deployment
@@ -47,39 +74,23 @@ class GameState:
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, map_class=GameMap):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn.
+                An EngineMessage or an already parsed dict is used as is, without parsing it again
+            * map_class: The GameMap class to store the board in. TableGameMap stores units in columns instead of a grid
 
         """
         self.serialized_string = serialized_string
         self.config = config
+        # The budget AlgoCore attached to the turn's message, submit_turn goes through it
+        self.turn_budget = getattr(serialized_string, "turn_budget", None)
         self.enable_warnings = True
 
-        global WALL, FACTORY, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        FACTORY = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[FACTORY] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, FACTORY, TURRET]
-        STRUCTURE_TYPES = [WALL, FACTORY, TURRET]
+        _bind_unit_types(config)
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
@@ -89,10 +100,12 @@ class GameState:
         MP = self.MP
         SP = self.SP
 
-        self.game_map = GameMap(self.config)
+        self.game_map = map_class(self.config)
         self._shortest_path_finder = ShortestPathFinder()
         self._build_stack = []
         self._deploy_stack = []
+        self._derived_cache = {}
+        self._undo_log = None
         self._player_resources = [
                 {'SP': 0, 'MP': 0},  # player 0, which is you
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
@@ -101,9 +114,9 @@ class GameState:
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, an EngineMessage or a parsed dict.
         """
-        state = json.loads(state_line)
+        state = parse_message(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -145,9 +158,9 @@ class GameState:
                 elif unit_type == UPGRADE:
                     if self.contains_stationary_unit([x,y]):
                         self.game_map[x,y][0].upgrade()
+                        self.game_map._mark_changed()
                 else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map._add_parsed_unit(unit_type, player_number, hp, x, y)
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -163,23 +176,100 @@ class GameState:
         elif resource_type == self.SP:
             resource_key = 'SP'
         held_resource = self.get_resource(resource_type, player_index)
+        if self._undo_log is not None:
+            self._undo_log.append((self._restore_resource, player_index, resource_key, self._player_resources[player_index][resource_key]))
         self._player_resources[player_index][resource_key] = held_resource + amount
 
+    def _restore_resource(self, player_index, resource_key, amount):
+        self._player_resources[player_index][resource_key] = amount
+
+    def _push(self, stack, entry):
+        """Appends to the build or deploy stack, recording it if a savepoint is active
+        """
+        if self._undo_log is not None:
+            self._undo_log.append((self._truncate, stack, len(stack)))
+        stack.append(entry)
+
+    def _truncate(self, stack, length):
+        del stack[length:]
+
     def _invalid_player_index(self, index):
-        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)".format(index))
+        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)", index)
     
     def _invalid_unit(self, unit):
-        self.warn("Invalid unit {}".format(unit))
+        self.warn("Invalid unit {}", unit)
 
     def submit_turn(self):
         """Submit and end your turn.
             Must be called at the end of your turn or the algo will hang.
+            During a turn run by AlgoCore only the first submission is sent, see TurnBudget.
         """
         build_string = json.dumps(self._build_stack)
         deploy_string = json.dumps(self._deploy_stack)
+        if self.turn_budget is not None:
+            self.turn_budget.submit(build_string, deploy_string)
+            return
         send_command(build_string)
         send_command(deploy_string)
 
+    def fork(self):
+        """Makes a hypothetical copy of this game state, for trying out moves without changing this one.
+
+        The fork shares unchanged parts of the map, see GameMap.fork, as well as the cached threat and
+        shield maps, so forking is cheap and a fork only costs memory for the changes made to it.
+        Submitting a fork's turn sends the fork's builds and deploys.
+
+        Returns:
+            A new GameState
+
+        """
+        child = copy.copy(self)
+        child.game_map = self.game_map.fork()
+        child._build_stack = list(self._build_stack)
+        child._deploy_stack = list(self._deploy_stack)
+        child._player_resources = [dict(resources) for resources in self._player_resources]
+        child._derived_cache = dict(self._derived_cache)
+        child._undo_log = None
+        return child
+
+    def savepoint(self):
+        """Marks a point that the game state can be rolled back to.
+
+        From the first savepoint on, every change made through attempt_spawn, attempt_remove, attempt_upgrade
+        and the GameMap functions is recorded, so rollback only has to undo the changes made since, and the
+        cached threat and shield maps of the restored board become valid again. Savepoints can be nested.
+        Call commit once you are done to stop recording.
+
+        Returns:
+            A savepoint to pass to rollback
+
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+            self.game_map._undo_log = self._undo_log
+        return len(self._undo_log)
+
+    def rollback(self, savepoint):
+        """Undoes every change made since a savepoint. The savepoint stays valid, and later ones are discarded
+
+        Args:
+            savepoint: A savepoint returned by savepoint
+
+        """
+        undo_log = self._undo_log
+        if undo_log is None or savepoint > len(undo_log):
+            self.warn("Attempted to roll back to savepoint {}, which is not active. Savepoints end when commit is called.", savepoint)
+            return
+        while len(undo_log) > savepoint:
+            undo = undo_log.pop()
+            undo[0](*undo[1:])
+
+    def commit(self):
+        """Keeps every change made since the first savepoint, ending all savepoints and stopping the recording of changes
+        """
+        self._undo_log = None
+        self.game_map._undo_log = None
+
     def get_resource(self, resource_type, player_index = 0):
         """Gets a players resources
 
@@ -195,7 +285,7 @@ class GameState:
             self._invalid_player_index(player_index)
             return
         if not resource_type == self.MP and not resource_type == self.SP:
-            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)".format(resource_type))
+            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)", resource_type)
             return
 
         if resource_type == self.MP:
@@ -264,11 +354,11 @@ class GameState:
         """
 
         if turns_in_future < 1 or turns_in_future > 99:
-            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99".format(turns_in_future))
+            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99", turns_in_future)
         if not player_index == 1 and not player_index == 0:
             self._invalid_player_index(player_index)
         if type(current_MP) == int and current_MP < 0:
-            self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
+            self.warn("Invalid current MP ({}). Current MP cannot be negative.", current_MP)
 
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
         for increment in range(1, turns_in_future + 1):
@@ -326,31 +416,35 @@ class GameState:
         
         if not self.game_map.in_arena_bounds(location):
             if self.enable_warnings:
-                self.warn("Could not spawn {} at location {}. Location invalid.".format(unit_type, location))
+                self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location)
             return False
 
         affordable = self.number_affordable(unit_type) >= num
         stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
-        correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
-
-        if self.enable_warnings:
-            fail_reason = ""
-            if not affordable:
-                fail_reason = fail_reason + " Not enough resources."
-            if blocked:
-                fail_reason = fail_reason + " Location is blocked."
-            if not correct_territory:
-                fail_reason = fail_reason + " Location in enemy territory."
-            if not (stationary or on_edge):
-                fail_reason = fail_reason + " Information units must be deployed on the edge."
-            if len(fail_reason) > 0:
-                self.warn("Could not spawn {} at location {}.{}".format(unit_type, location, fail_reason))
-
-        return (affordable and correct_territory and not blocked and
-                (stationary or on_edge) and
-                (not stationary or num == 1))
+        fail_reason = self._spawn_fail_reason(location, stationary, affordable)
+        if fail_reason and self.enable_warnings:
+            self.warn("Could not spawn {} at location {}.{}", unit_type, location, fail_reason)
+
+        return not fail_reason and (not stationary or num == 1)
+
+    def _spawn_fail_reason(self, location, stationary, affordable=True):
+        """Checks an in bounds location against the occupancy bitmaps and the friendly edge tiles
+
+        Returns:
+            Why a unit cannot be spawned there, or an empty string if it can
+
+        """
+        index = int(location[0]) * self.ARENA_SIZE + int(location[1])
+        fail_reason = ""
+        if not affordable:
+            fail_reason = fail_reason + " Not enough resources."
+        if self.game_map._structures[index] == 1 or (stationary and self.game_map._occupied[index] == 1):
+            fail_reason = fail_reason + " Location is blocked."
+        if not location[1] < self.HALF_ARENA:
+            fail_reason = fail_reason + " Location in enemy territory."
+        if not (stationary or index in FRIENDLY_EDGE_TILES):
+            fail_reason = fail_reason + " Information units must be deployed on the edge."
+        return fail_reason
 
     def attempt_spawn(self, unit_type, locations, num=1):
         """Attempts to spawn new units with the type given in the given locations.
@@ -368,28 +462,76 @@ class GameState:
             self._invalid_unit(unit_type)
             return
         if num < 1:
-            self.warn("Attempted to spawn fewer than one units! ({})".format(num))
+            self.warn("Attempted to spawn fewer than one units! ({})", num)
             return
       
         if type(locations[0]) == int:
             locations = [locations]
-        spawned_units = 0
-        for location in locations:
-            for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    costs = self.type_cost(unit_type)
-                    self.__set_resource(SP, 0 - costs[SP])
-                    self.__set_resource(MP, 0 - costs[MP])
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
-                else:
-                    break
-        return spawned_units
+        return sum(self.attempt_spawn_many([(unit_type, location, num) for location in locations]))
+
+    def attempt_spawn_many(self, commands):
+        """Attempts to spawn several batches of units, checking each batch once rather than once per unit.
+
+        Commands are carried out in order, as if attempt_spawn was called for each of them, so a command
+        sees the resources and tiles used by the ones before it. A command spawns as many of its units as
+        can be afforded, or only one if the unit is a structure.
+
+        Args:
+            commands: A list of (unit_type, location, count) tuples. The count may be left out to spawn one unit
+
+        Returns:
+            A list with the number of units spawned by each command
+
+        """
+        held = self.get_resources()
+        sp, mp = held[SP], held[MP]
+        builds = []
+        deploys = []
+        spawned = []
+        for command in commands:
+            unit_type, location = command[0], command[1]
+            count = command[2] if len(command) > 2 else 1
+            if unit_type not in ALL_UNITS:
+                self._invalid_unit(unit_type)
+                spawned.append(0)
+                continue
+            if count < 1:
+                self.warn("Attempted to spawn fewer than one units! ({})", count)
+                spawned.append(0)
+                continue
+            if not self.game_map.in_arena_bounds(location):
+                self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location)
+                spawned.append(0)
+                continue
+
+            costs = self.type_cost(unit_type)
+            limits = [math.floor(amount / cost) for amount, cost in ((sp, costs[SP]), (mp, costs[MP])) if cost > 0]
+            if not limits:
+                self.warn("Invalid costs for unit, cost is 0 for both resources, returning 0")
+            affordable = min(limits) if limits else 0
+            stationary = is_stationary(unit_type)
+            number = 0 if self._spawn_fail_reason(location, stationary) else min(count, affordable, 1 if stationary else count)
+            spawned.append(number)
+            if number > 0:
+                x, y = map(int, location)
+                sp -= costs[SP] * number
+                mp -= costs[MP] * number
+                self.game_map._place_units(unit_type, [x, y], number)
+                (builds if stationary else deploys).extend([(unit_type, x, y)] * number)
+            if number < count and self.enable_warnings:
+                # The reason the next unit could not be spawned, as attempt_spawn would report it
+                self.warn("Could not spawn {} at location {}.{}", unit_type, location,
+                          self._spawn_fail_reason(location, stationary, affordable > number))
+
+        for stack, entries in ((self._build_stack, builds), (self._deploy_stack, deploys)):
+            if entries:
+                if self._undo_log is not None:
+                    self._undo_log.append((self._truncate, stack, len(stack)))
+                stack.extend(entries)
+        if builds or deploys:
+            self.__set_resource(SP, sp - held[SP])
+            self.__set_resource(MP, mp - held[MP])
+        return spawned
 
     def attempt_remove(self, locations):
         """Attempts to remove existing friendly structures in the given locations.
@@ -407,10 +549,10 @@ class GameState:
         for location in locations:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
-                self._build_stack.append((REMOVE, x, y))
+                self._push(self._build_stack, (REMOVE, x, y))
                 removed_units += 1
             else:
-                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.", location)
         return removed_units
 
     def attempt_upgrade(self, locations):
@@ -431,7 +573,7 @@ class GameState:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
                 existing_unit = None
-                for unit in self.game_map[x,y]:
+                for unit in self.game_map._units_at(x, y):
                     if unit.stationary:
                         existing_unit = unit
 
@@ -441,11 +583,11 @@ class GameState:
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
+                        self.game_map._upgrade_structure(x, y)
+                        self._push(self._build_stack, (UPGRADE, x, y))
                         spawned_units += 1
             else:
-                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.", location)
         return spawned_units
 
     def get_target_edge(self, start_location):
@@ -485,7 +627,7 @@ class GameState:
 
         """
         if self.contains_stationary_unit(start_location):
-            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            self.warn("Attempted to perform pathing from blocked starting location {}", start_location)
             return
 
         if target_edge is None:
@@ -494,6 +636,36 @@ class GameState:
         end_points = self.game_map.get_edge_locations(target_edge)
         return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
 
+    def find_paths_to_edges(self, start_locations, target_edge=None):
+        """Gets the paths units at several locations would take, in one batched query.
+
+        Much faster than calling find_path_to_edge for every location, as the pathfinding
+        work is shared between locations that target the same edge.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from each start_location if None.
+
+        Returns:
+            A dict mapping each starting location, as an (x, y) tuple, to the path a unit there would take.
+            Locations that are blocked by a structure map to None.
+
+        """
+        paths = {}
+        starts_by_edge = {}
+        for start_location in start_locations:
+            paths[tuple(start_location)] = None
+            if self.contains_stationary_unit(start_location):
+                self.warn("Attempted to perform pathing from blocked starting location {}", start_location)
+                continue
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            starts_by_edge.setdefault(edge, []).append(start_location)
+
+        for edge, starts in starts_by_edge.items():
+            end_points = self.game_map.get_edge_locations(edge)
+            paths.update(self._shortest_path_finder.navigate_multiple_starts(starts, end_points, self))
+        return paths
+
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
 
@@ -508,17 +680,20 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
-        for unit in self.game_map[x,y]:
+        if not self.game_map._is_blocked(x, y):
+            return False
+        for unit in self.game_map._units_at(x, y):
             if unit.stationary:
                 return unit
         return False
 
-    def warn(self, message):
-        """ Used internally by game_state to print warnings
+    def warn(self, message, *args):
+        """ Used internally by game_state to print warnings.
+        The message is formatted with args only if it is written out, see util.log
         """
 
         if(self.enable_warnings):
-            debug_write(message)
+            warn(message, *args)
 
     def suppress_warnings(self, suppress):
         """Suppress all warnings
@@ -547,7 +722,7 @@ class GameState:
         """
 
         if not isinstance(attacking_unit, GameUnit):
-            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.".format(type(attacking_unit)))
+            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.", type(attacking_unit))
             return
 
         attacker_location = [attacking_unit.x, attacking_unit.y]
@@ -560,7 +735,7 @@ class GameState:
         target_x_distance = 0
 
         for location in possible_locations:
-            for unit in self.game_map[location]:
+            for unit in self.game_map._units_at(*location):
                 if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
                     continue
 
@@ -625,7 +800,7 @@ class GameState:
         if not player_index == 0 and not player_index == 1:
             self._invalid_player_index(player_index)
         if not self.game_map.in_arena_bounds(location):
-            self.warn("Location {} is not in the arena bounds.".format(location))
+            self.warn("Location {} is not in the arena bounds.", location)
 
         attackers = []
         """
@@ -636,8 +811,101 @@ class GameState:
             if unit.get('attackRange', 0) >= max_range:
                 max_range = unit.get('attackRange', 0)
         possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        x, y = location
         for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
-                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
+            distance_squared = (x - location_unit[0]) ** 2 + (y - location_unit[1]) ** 2
+            for unit in self.game_map._units_at(*location_unit):
+                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and distance_squared <= unit.attackRange ** 2:
                     attackers.append(unit)
         return attackers
+
+    def _cached(self, key, build):
+        """Returns a value derived from the game map, rebuilding it only if the map changed since it was cached
+        """
+        revision = self.game_map._revision
+        entry = self._derived_cache.get(key)
+        if entry is not None and entry[0] == revision:
+            return entry[1]
+        value = build()
+        self._derived_cache[key] = (revision, value)
+        return value
+
+    def _stamp(self, stamps):
+        """Sums (tiles, value) stamps into a per tile array
+
+        Returns:
+            A 28x28 numpy array if numpy is installed, otherwise a list of 28 lists of 28 floats. Either is indexed [x][y]
+        """
+        if numpy is not None:
+            indices = []
+            weights = []
+            for tiles, value in stamps:
+                indices.extend(tiles)
+                weights.extend([value] * len(tiles))
+            return numpy.bincount(indices, weights, minlength=TILE_COUNT).reshape(ARENA_SIZE, ARENA_SIZE)
+
+        flat = [0.0] * TILE_COUNT
+        for tiles, value in stamps:
+            for index in tiles:
+                flat[index] += value
+        return [flat[x * ARENA_SIZE:(x + 1) * ARENA_SIZE] for x in range(ARENA_SIZE)]
+
+    def threat_map(self, player_index):
+        """Gets the damage per frame a mobile unit of the given player would take at each location from enemy structures
+
+        Each enemy structure that attacks mobile units adds its damage (including upgrades) to every location
+        within its attack range, using the same range rule as get_attackers. The damage a unit takes walking
+        a path can then be estimated by summing threat[x][y] over the path.
+
+        The map is cached until the game map changes, so treat it as read only.
+
+        Args:
+            player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            A 28x28 numpy array if numpy is installed, otherwise a list of 28 lists of 28 floats. Either is indexed [x][y]
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+
+        def build():
+            stamps = []
+            for unit in self.game_map._structure_units():
+                if unit.player_index != player_index and unit.damage_i > 0:
+                    stamps.append((tiles_in_range(unit.x, unit.y, unit.attackRange, 0, True), unit.damage_i))
+            return self._stamp(stamps)
+        return self._cached(("threat", player_index), build)
+
+    def shield_map(self, player_index):
+        """Gets the shield a mobile unit of the given player would receive at each location from friendly support structures
+
+        Each support structure adds shieldPerUnit plus shieldBonusPerY for every row it sits away from its
+        owner's edge (both including upgrades) to every location within its shield range. Like threat_map
+        the result is cached until the game map changes, for example by attempt_spawn or attempt_upgrade.
+
+        Args:
+            player_index: The index corresponding to the player being shielded, 0 for you 1 for the enemy
+
+        Returns:
+            A 28x28 numpy array if numpy is installed, otherwise a list of 28 lists of 28 floats. Either is indexed [x][y]
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+
+        def build():
+            hit_radius = self.game_map._hit_radius
+            stamps = []
+            for unit in self.game_map._structure_units():
+                if unit.player_index != player_index or unit.shieldRange <= 0:
+                    continue
+                rows = unit.y if player_index == 0 else self.ARENA_SIZE - 1 - unit.y
+                shield = unit.shieldPerUnit + unit.shieldBonusPerY * rows
+                if shield > 0:
+                    stamps.append((tiles_in_range(unit.x, unit.y, unit.shieldRange, hit_radius), shield))
+            return self._stamp(stamps)
+        return self._cached(("shield", player_index), build)
+
@@ -0,0 +1,151 @@
+"""
+Precomputed tables describing the shape of the arena.
+
+The arena is a diamond inside a 28 x 28 grid. Everything here depends only on that
+shape, so it is built once at import and shared by GameMap, GameState and the
+pathfinder. Tiles are addressed by a flat index, x * ARENA_SIZE + y.
+"""
+import math
+
+ARENA_SIZE = 28
+HALF_ARENA = ARENA_SIZE // 2
+TILE_COUNT = ARENA_SIZE * ARENA_SIZE
+
+TOP_RIGHT = 0
+TOP_LEFT = 1
+BOTTOM_LEFT = 2
+BOTTOM_RIGHT = 3
+
+
+def tile_index(x, y):
+    """Gets the flat index of a grid location
+    """
+    return x * ARENA_SIZE + y
+
+
+def tile_location(index):
+    """Gets the [x, y] location of a flat index
+    """
+    return list(divmod(index, ARENA_SIZE))
+
+
+def in_arena_bounds(x, y):
+    """Checks if a location is inside the diamond shaped game board using the diamond arithmetic.
+    Prefer BOUNDS_MASK for integer locations, this is used to build it and for anything else.
+    """
+    if x < 0 or y < 0 or x >= ARENA_SIZE or y >= ARENA_SIZE:
+        return False
+    row_size = y + 1 if y < HALF_ARENA else ARENA_SIZE - y
+    startx = HALF_ARENA - row_size
+    endx = startx + (2 * row_size) - 1
+    return startx <= x <= endx
+
+
+def _build_edges():
+    top_right = tuple((HALF_ARENA + num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    top_left = tuple((HALF_ARENA - 1 - num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    bottom_left = tuple((HALF_ARENA - 1 - num, num) for num in range(HALF_ARENA))
+    bottom_right = tuple((HALF_ARENA + num, num) for num in range(HALF_ARENA))
+    return (top_right, top_left, bottom_left, bottom_right)
+
+
+def _build_neighbors():
+    neighbors = []
+    for index in range(TILE_COUNT):
+        x, y = divmod(index, ARENA_SIZE)
+        # Up, down, right, left. Pathing tie breaks depend on this order
+        candidates = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+        neighbors.append(tuple(tile_index(nx, ny) for nx, ny in candidates if in_arena_bounds(nx, ny)))
+    return tuple(neighbors)
+
+
+# BOUNDS_MASK[tile_index(x, y)] is 1 for tiles inside the arena and 0 for the corners outside it
+BOUNDS_MASK = bytes(1 if in_arena_bounds(*divmod(index, ARENA_SIZE)) else 0 for index in range(TILE_COUNT))
+
+# TILE_LOCATIONS[index] is the (x, y) location of a flat index
+TILE_LOCATIONS = tuple(divmod(index, ARENA_SIZE) for index in range(TILE_COUNT))
+
+# Every arena location, in the order GameMap iterates them: row by row from the bottom, left to right
+ARENA_LOCATIONS = tuple((x, y) for y in range(ARENA_SIZE) for x in range(ARENA_SIZE) if in_arena_bounds(x, y))
+ARENA_TILES = tuple(tile_index(x, y) for x, y in ARENA_LOCATIONS)
+
+# ARENA_ORDER[index] is the position of a tile in ARENA_TILES, or -1 for tiles outside the arena
+_positions = {index: position for position, index in enumerate(ARENA_TILES)}
+ARENA_ORDER = tuple(_positions.get(index, -1) for index in range(TILE_COUNT))
+
+# Edge locations, indexed by TOP_RIGHT, TOP_LEFT, BOTTOM_LEFT and BOTTOM_RIGHT
+EDGES = _build_edges()
+EDGE_TILES = tuple(tuple(tile_index(x, y) for x, y in edge) for edge in EDGES)
+EDGE_TILE_SETS = tuple(frozenset(edge) for edge in EDGE_TILES)
+# The edges your mobile units are deployed from
+FRIENDLY_EDGE_TILES = EDGE_TILE_SETS[BOTTOM_LEFT] | EDGE_TILE_SETS[BOTTOM_RIGHT]
+
+# NEIGHBORS[index] holds the flat indices of the in-arena tiles next to a tile
+NEIGHBORS = _build_neighbors()
+
+
+"""
+Range stencils. A stencil is the set of integer (dx, dy) offsets whose distance from the
+center is less than radius + hit_radius, or at most that much if inclusive. Stencils only
+need to be built once per distinct radius, and once clipped against the bounds mask the
+tiles in range of each center are cached as well, so no distances are computed per query.
+"""
+_STENCILS = {}
+
+
+def range_stencil(radius, hit_radius=0.0, inclusive=False):
+    """Gets the offsets within a radius of a tile
+
+    Args:
+        radius: The range of the effect
+        hit_radius: Extra reach added to radius, see the getHitRadius entry of the config
+        inclusive: If True, offsets exactly radius + hit_radius away are included
+
+    Returns:
+        A tuple of (dx, dy) offsets in order of dx, then dy
+
+    """
+    return _get_stencil(radius, hit_radius, inclusive)[0]
+
+
+def tiles_in_range(x, y, radius, hit_radius=0.0, inclusive=False):
+    """Gets the arena tiles within a radius of a location, see range_stencil
+
+    Returns:
+        A tuple of flat tile indices in increasing order
+
+    """
+    offsets, clipped = _get_stencil(radius, hit_radius, inclusive)
+    on_grid = 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE
+    if on_grid:
+        tiles = clipped[x * ARENA_SIZE + y]
+        if tiles is not None:
+            return tiles
+    tiles = []
+    for dx, dy in offsets:
+        tx = x + dx
+        ty = y + dy
+        if 0 <= tx < ARENA_SIZE and 0 <= ty < ARENA_SIZE and BOUNDS_MASK[tx * ARENA_SIZE + ty]:
+            tiles.append(tx * ARENA_SIZE + ty)
+    tiles = tuple(tiles)
+    if on_grid:
+        clipped[x * ARENA_SIZE + y] = tiles
+    return tiles
+
+
+def _get_stencil(radius, hit_radius, inclusive):
+    key = (radius, hit_radius, inclusive)
+    stencil = _STENCILS.get(key)
+    if stencil is None:
+        # Like a scan of the square around the center, only offsets up to ceil(radius) away count
+        reach = math.ceil(radius)
+        limit = (radius + hit_radius) ** 2
+        offsets = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                distance = dx * dx + dy * dy
+                if distance < limit or (inclusive and distance == limit):
+                    offsets.append((dx, dy))
+        stencil = (tuple(offsets), [None] * TILE_COUNT)
+        _STENCILS[key] = stencil
+    return stencil
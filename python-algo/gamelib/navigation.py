@@ -1,45 +1,136 @@
 import heapq
-import math
 import sys
-import queue
+from collections import OrderedDict
 from .util import debug_write
+from .geometry import ARENA_SIZE, HALF_ARENA, TILE_COUNT, NEIGHBORS
 
-class Node:
-    """A pathfinding node
+"""
+Pathfinding works on flat buffers indexed by tile, see geometry.py. The idealness
+tables only depend on the shape of the arena, so they are built once at import and
+shared by every pathfinder.
+"""
+
+
+def _build_idealness(direction):
+    """Idealness of every tile for units heading towards the edge in the given [x, y] direction"""
+    table = []
+    for index in range(TILE_COUNT):
+        x, y = divmod(index, ARENA_SIZE)
+        idealness = 28 * y if direction[1] == 1 else 28 * (27 - y)
+        idealness += x if direction[0] == 1 else (27 - x)
+        table.append(idealness)
+    return table
+
+
+_IDEALNESS = {(dx, dy): _build_idealness([dx, dy]) for dx in (1, -1) for dy in (1, -1)}
+
+
+class PathCache:
+    """A bounded least recently used cache of paths
+
+    A path only depends on the structure layout, the starting location and the target edge, so
+    paths are keyed by the game map's layout hash together with the start and edge tiles.
+    Entries stay valid for as long as a layout is seen again, including on later turns.
 
     Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
+        * max_size (int): The most paths kept before the least recently used ones are evicted. 0 disables caching
+        * hits (int): The number of lookups that found a path
+        * misses (int): The number of lookups that did not
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key, start_point):
+        """Looks up a path
+
+        Args:
+            * key: A key built by the pathfinder
+            * start_point: The starting location, used as the first step of the returned path
+
+        Returns:
+            A fresh copy of the cached path, or None if it is not cached
+
+        """
+        steps = self.__entries.get(key)
+        if steps is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        path = [start_point]
+        path.extend([x, y] for x, y in steps)
+        return path
+
+    def put(self, key, path):
+        """Stores a path, evicting the least recently used path if the cache is full
+        """
+        if self.max_size <= 0:
+            return
+        self.__entries[key] = tuple((x, y) for x, y in path[1:])
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def merge(self, other):
+        """Copies every path stored in another cache into this one, as the most recently used paths
+        """
+        if self.max_size <= 0:
+            return
+        for key, steps in other.__entries.items():
+            self.__entries[key] = steps
+            self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        """Removes every path and resets the hit and miss counters
+        """
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
 
 """
-This class helps with pathfinding. We guarantee the results will
-be accurate, but top players may want to write their own pathfinding
-code to maximise time efficiency
+Paths are shared by every pathfinder that is not given its own cache, so a layout that
+comes back on a later turn, or in a copy of the game state, is solved only once.
 """
+default_path_cache = PathCache()
+
+
 class ShortestPathFinder:
     """Handles pathfinding
 
+    The pathfinder keeps its working buffers between calls. Instead of clearing them,
+    each search bumps a generation counter, and a tile only counts as visited if its
+    mark matches the current generation. Finished paths are stored in a PathCache.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
 
         * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * initialized (bool): True once the pathfinder has been pointed at a gamestate
+        * path_cache (:obj: PathCache): The cache paths are stored in, default_path_cache unless another is given
 
     """
-    def __init__(self):
+    def __init__(self, path_cache=None):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.game_state = None
+        self.path_cache = default_path_cache if path_cache is None else path_cache
+        self._blocked = bytes(TILE_COUNT)
+        self._pathlength = [-1] * TILE_COUNT
+        self._visited_idealness = [0] * TILE_COUNT
+        self._visited_validate = [0] * TILE_COUNT
+        self._generation = 0
 
     def initialize_map(self, game_state):
         """Initializes the map
@@ -47,10 +138,11 @@ class ShortestPathFinder:
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self._generation += 1
+        # The game map keeps its structure bitmap up to date, so it can be read as is
+        self._blocked = game_state.game_map._structures
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,223 +160,246 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
+        start = start_point[0] * ARENA_SIZE + start_point[1]
+        seeds = tuple(x * ARENA_SIZE + y for x, y in end_points)
+        key = (game_state.game_map.layout_hash(), start, seeds)
+        path = self.path_cache.get(key, start_point)
+        if path is not None:
+            return path
+
         self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
-        #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
-
-    def _idealness_search(self, start, end_points):
-        """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
-        The edge if it is available, or the best self destruct location otherwise
-        """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
-        most_ideal = start
+        targets = frozenset(seeds)
+        direction = self._get_direction_from_endpoints(end_points)
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
+        ideal_tile = self._idealness_search(start, targets, _IDEALNESS[tuple(direction)])
+        self._validate(ideal_tile, seeds, targets)
+        path = self._get_path(start_point, direction)
+        self.path_cache.put(key, path)
+        return path
 
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
+    def navigate_multiple_starts(self, start_points, end_points, game_state):
+        """Finds the paths units at several starting locations would take to reach the same set of endpoints
 
-                if current_idealness > best_idealness:
-                    best_idealness = current_idealness
-                    most_ideal = neighbor
+        Starting locations in the same pocket of pathable space share their most ideal tile,
+        so the idealness search runs once per pocket and the pathlength field is computed
+        once per distinct ideal tile instead of once per start.
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
 
-        return most_ideal
+        Returns:
+            A dict mapping each starting location, as an (x, y) tuple, to the path a unit there would take.
+            Starting locations that are blocked by a structure map to None.
+
+        """
+        self.initialize_map(game_state)
+        blocked = self._blocked
+        layout_hash = game_state.game_map.layout_hash()
+        seeds = tuple(x * ARENA_SIZE + y for x, y in end_points)
+        targets = frozenset(seeds)
+        direction = self._get_direction_from_endpoints(end_points)
+        idealness = _IDEALNESS[tuple(direction)]
+
+        paths = {}
+        pocket_of = {}
+        starts_by_ideal = {}
+        for start_point in start_points:
+            paths[tuple(start_point)] = None
+            start = start_point[0] * ARENA_SIZE + start_point[1]
+            if blocked[start]:
+                continue
+            path = self.path_cache.get((layout_hash, start, seeds), start_point)
+            if path is not None:
+                paths[tuple(start_point)] = path
+                continue
+            ideal_tile = pocket_of.get(start)
+            if ideal_tile is None:
+                # Explore the whole pocket so every start inside it can reuse the result
+                ideal_tile, pocket = self._search_pocket(start, targets, idealness, False)
+                for location in pocket:
+                    pocket_of[location] = ideal_tile
+            # Every pocket that can reach the edge shares the same field
+            field = -1 if ideal_tile in targets else ideal_tile
+            starts_by_ideal.setdefault(field, (ideal_tile, []))[1].append(start_point)
+
+        for ideal_tile, starts in starts_by_ideal.values():
+            self._generation += 1
+            self._validate(ideal_tile, seeds, targets)
+            for start_point in starts:
+                path = self._get_path(start_point, direction)
+                self.path_cache.put((layout_hash, start_point[0] * ARENA_SIZE + start_point[1], seeds), path)
+                paths[tuple(start_point)] = path
+        return paths
+
+    def _idealness_search(self, start, targets, idealness):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space.
+        The edge if it is available, or the best self destruct location otherwise
+        """
+        return self._search_pocket(start, targets, idealness)[0]
 
-    def _get_neighbors(self, location):
-        """Get the locations adjacent to a location
+    def _search_pocket(self, start, targets, idealness, stop_at_target=True):
         """
-        x, y = location
-        return [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]
+        Runs the idealness search, returning the most ideal tile and the tiles of the pocket it visited.
+        Every edge tile is perfectly ideal, so unless stop_at_target is False the search stops at the first one it reaches.
+        """
+        generation = self._generation
+        visited = self._visited_idealness
+        blocked = self._blocked
+        visited[start] = generation
+        current = [start]
+        if start in targets:
+            return start, current
+
+        best_idealness = idealness[start]
+        most_ideal = start
+        for search_location in current:
+            for neighbor in NEIGHBORS[search_location]:
+                if blocked[neighbor]:
+                    continue
+                if neighbor in targets:
+                    if stop_at_target:
+                        return neighbor, current
+                    best_idealness = sys.maxsize
+                    most_ideal = neighbor
+                elif idealness[neighbor] > best_idealness:
+                    best_idealness = idealness[neighbor]
+                    most_ideal = neighbor
+                if visited[neighbor] != generation:
+                    visited[neighbor] = generation
+                    current.append(neighbor)
+
+        return most_ideal, current
 
     def _get_direction_from_endpoints(self, end_points):
-        """Prints a message to the games debug output
+        """Gets the direction of the edge a set of endpoints lies on
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
+            * end_points: A set of endpoints, should be an edge
 
         Returns:
             A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
 
         """
-        point = end_points[0]
-        x, y = point
+        x, y = end_points[0]
         direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
-           direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
+        if x < HALF_ARENA:
+            direction[0] = -1
+        if y < HALF_ARENA:
             direction[1] = -1
         return direction
 
-    def _get_idealness(self, location, end_points):
-        """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+    def _validate(self, ideal_tile, seeds, targets):
+        """Breadth first search of the grid, setting the pathlengths of each reachable tile
 
-        Returns:
-            A location the unit will attempt to reach
         """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
+        generation = self._generation
+        visited = self._visited_validate
+        pathlength = self._pathlength
+        blocked = self._blocked
 
-        idealness = 0
-        if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
-
-    def _validate(self, ideal_tile, end_points):
-        """Breadth first search of the grid, setting the pathlengths of each node
-
-        """
-        #VALDIATION
-        #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
+        if ideal_tile in targets:
+            current = list(seeds)
         else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+            current = [ideal_tile]
+        for location in current:
+            pathlength[location] = 0
+            visited[location] = generation
+
+        for current_location in current:
+            # Blocked edge tiles are still targets, but units can not path through them
+            if blocked[current_location]:
+                continue
+            next_pathlength = pathlength[current_location] + 1
+            for neighbor in NEIGHBORS[current_location]:
+                if blocked[neighbor] or visited[neighbor] == generation:
                     continue
+                pathlength[neighbor] = next_pathlength
+                visited[neighbor] = generation
+                current.append(neighbor)
 
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
-
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
+    def _get_pathlength(self, index):
+        """The pathlength of a tile in the current search, or -1 if the search never reached it
+        """
+        if self._visited_validate[index] == self._generation:
+            return self._pathlength[index]
+        return -1
 
-    def _get_path(self, start_point, end_points):
-        """Once all nodes are validated, and a target is found, the unit can path to its target
+    def _get_path(self, start_point, direction):
+        """Once all tiles are validated, and a target is found, the unit can path to its target
 
         """
-        #GET THE PATH
         path = [start_point]
-        current = start_point
+        current = start_point[0] * ARENA_SIZE + start_point[1]
         move_direction = 0
 
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
+        while not self._get_pathlength(current) == 0:
+            next_move = self._choose_next_move(current, move_direction, direction)
 
-            if current[0] == next_move[0]:
+            if current // ARENA_SIZE == next_move // ARENA_SIZE:
                 move_direction = self.VERTICAL
             else:
                 move_direction = self.HORIZONTAL
-            path.append(next_move)
+            path.append(list(divmod(next_move, ARENA_SIZE)))
             current = next_move
-        
-        #debug_write(path)
+
         return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
+
+    def _choose_next_move(self, current_point, previous_move_direction, direction):
         """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
         """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
-
+        blocked = self._blocked
         ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        best_pathlength = self._get_pathlength(current_point)
+        for neighbor in NEIGHBORS[current_point]:
+            if blocked[neighbor]:
                 continue
 
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
+            current_pathlength = self._get_pathlength(neighbor)
 
             #Filter by pathlength
             if current_pathlength > best_pathlength:
                 continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
-
             #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
+            if current_pathlength == best_pathlength and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, direction):
                 continue
 
             ideal_neighbor = neighbor
             best_pathlength = current_pathlength
 
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
         return ideal_neighbor
 
-    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
+    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, direction):
         """Compare two tiles and return True if the unit would rather move to the new one
 
         """
+        prev_x, prev_y = divmod(prev_tile, ARENA_SIZE)
+        new_x, new_y = divmod(new_tile, ARENA_SIZE)
+        best_x, best_y = divmod(prev_best, ARENA_SIZE)
+
         #True if we are moving in a different direction than prev move and prev is not
         #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
-        if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
+        if previous_move_direction == self.HORIZONTAL and not new_x == best_x:
             #We want to go up now. If we have not changed our y, we are not going up
-            if prev_tile[1] == new_tile[1]:
-                return False 
-            return True
-        if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
-            if prev_tile[0] == new_tile[0]:
-                #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
-                return False
-            return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
-                return False
-            return True
-        
-        #To make it here, both moves are on the same axis 
-        direction = self._get_direction_from_endpoints(end_points)
-        if new_tile[1] == prev_best[1]: #If they both moved horizontal...
-            if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
-            if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
-        if new_tile[0] == prev_best[0]: #If they both moved vertical...
-            if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
+            return not prev_y == new_y
+        if previous_move_direction == self.VERTICAL and not new_y == best_y:
+            return not prev_x == new_x
+        if previous_move_direction == 0:
+            return not prev_y == new_y
+
+        #To make it here, both moves are on the same axis
+        if new_y == best_y: #If they both moved horizontal...
+            if direction[0] == 1 and new_x > best_x: #If we moved right and right is our direction, we moved towards our direction
+                return True
+            if direction[0] == -1 and new_x < best_x: #If we moved left and left is our direction, we moved towards our direction
+                return True
+            return False
+        if new_x == best_x: #If they both moved vertical...
+            if direction[1] == 1 and new_y > best_y: #If we moved up and up is our direction, we moved towards our direction
                 return True
-            if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
+            if direction[1] == -1 and new_y < best_y: #If we moved down and down is our direction, we moved towards our direction
                 return True
             return False
         return True
@@ -297,20 +412,233 @@ class ShortestPathFinder:
             debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
             return
 
-        for y in range(28):
-            for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+        for y in range(ARENA_SIZE):
+            row = []
+            for x in range(ARENA_SIZE):
+                index = x * ARENA_SIZE + (ARENA_SIZE - y - 1)
+                pathlength = self._get_pathlength(index)
+                if not self._blocked[index] and not pathlength == -1:
+                    row.append(self._justified(pathlength))
                 else:
-                    sys.stderr.write("   ")
-            debug_write("")
+                    row.append("   ")
+            # Each row is one message, as the debug output is buffered
+            debug_write("".join(row))
 
-    def _print_justified(self, number):
-        """Prints a number between 100 and -10 in 3 spaces
+    def _justified(self, number):
+        """Formats a number between 100 and -10 in 3 spaces
 
         """
         if number < 10 and number > -1:
-            sys.stderr.write(" ")
-        sys.stderr.write(str(number))
-        sys.stderr.write(" ")
+            return " " + str(number) + " "
+        return str(number) + " "
+
+
+class PathField:
+    """A pathlength field towards one edge that is repaired, rather than recomputed, when a single tile changes
+
+    Evaluating a hypothetical structure by pathing from scratch repeats the whole breadth first search.
+    A PathField keeps its own copy of the blocked tiles and the pathlength of every tile. When one tile is
+    blocked or unblocked it only recomputes the tiles whose pathlength depended on that tile, then
+    re-extracts the paths of the tracked starting locations that could have been affected.
+
+    Starting locations whose pocket can not reach the edge take self destruct paths, which depend on the
+    whole pocket, so those paths are recomputed after every change.
+
+    Paths match the ones ShortestPathFinder returns for the same blocked tiles.
+
+    Attributes :
+        * end_points (list): The edge locations the field leads to
+
+    """
+    def __init__(self, game_state, end_points, start_points=()):
+        """Builds the field from the structures currently on the game map
+
+        Args:
+            * game_state: The game state whose structure layout the field starts from. Later changes to it are not seen
+            * end_points: The end points of the units, should be a list of edge locations
+            * start_points: Starting locations whose paths should be tracked
+
+        """
+        self.end_points = [list(location) for location in end_points]
+        self._blocked = bytearray(game_state.game_map._structures)
+        # The field lives in the buffers of one pathfinder, self destruct paths are solved in another
+        self._field = ShortestPathFinder(PathCache(0))
+        self._scratch = ShortestPathFinder(PathCache(0))
+        self._field._blocked = self._blocked
+        self._scratch._blocked = self._blocked
+        self._seeds = tuple(x * ARENA_SIZE + y for x, y in end_points)
+        self._targets = frozenset(self._seeds)
+        self._direction = self._field._get_direction_from_endpoints(end_points)
+        self._field._generation = 1
+        self._field._validate(self._seeds[0], self._seeds, self._targets)
+        self._tracked = {}
+        self.track(start_points)
+
+    def track(self, start_points):
+        """Starts tracking the paths of more starting locations
+
+        Args:
+            * start_points: A list of starting locations
+        """
+        for start_point in start_points:
+            start_point = list(start_point)
+            self._tracked[tuple(start_point)] = self._solve(start_point)
+
+    def path(self, start_point):
+        """Gets the current path of a starting location, tracking it if it is not tracked yet
+
+        Returns:
+            The path a unit at start_point would take, or None if start_point is blocked
+
+        """
+        key = tuple(start_point)
+        if key not in self._tracked:
+            self.track([start_point])
+        path = self._tracked[key][0]
+        return None if path is None else [list(location) for location in path]
+
+    def pathlength(self, location):
+        """Gets the number of steps between a location and the edge
+
+        Returns:
+            The pathlength, or -1 if the location can not reach the edge
+
+        """
+        return self._field._get_pathlength(location[0] * ARENA_SIZE + location[1])
+
+    def set_blocked(self, location, blocked=True):
+        """Blocks or unblocks a single tile and repairs the field
+
+        Args:
+            * location: The location of the tile
+            * blocked: True if a structure is placed on the tile, False if it is removed
+
+        Returns:
+            A list of the tracked starting locations whose paths changed
+
+        """
+        index = location[0] * ARENA_SIZE + location[1]
+        if (self._blocked[index] == 1) == blocked:
+            return []
+        self._blocked[index] = 1 if blocked else 0
+        changed = self._repair_block(index) if blocked else self._repair_unblock(index)
+        changed.add(index)
+
+        # Extracting a path reads the path's tiles and their neighbors, so a path that
+        # touches none of the changed tiles or their neighbors can not have changed
+        dirty = set(changed)
+        for tile in changed:
+            dirty.update(NEIGHBORS[tile])
+
+        moved = []
+        for key, (path, tiles, self_destruct) in self._tracked.items():
+            if path is not None and not self_destruct and tiles.isdisjoint(dirty):
+                continue
+            solved = self._solve(path[0] if path is not None else list(key))
+            if solved[0] != path:
+                moved.append(list(key))
+            self._tracked[key] = solved
+        return moved
+
+    def _solve(self, start_point):
+        """Finds the path of a single start, returning the path, its tiles, and whether it is a self destruct path
+        """
+        start = start_point[0] * ARENA_SIZE + start_point[1]
+        if self._blocked[start]:
+            return None, frozenset(), False
+        if self._field._get_pathlength(start) >= 0:
+            path = self._field._get_path(start_point, self._direction)
+            return path, frozenset(x * ARENA_SIZE + y for x, y in path), False
+
+        scratch = self._scratch
+        scratch._generation += 1
+        ideal_tile = scratch._idealness_search(start, self._targets, _IDEALNESS[tuple(self._direction)])
+        scratch._validate(ideal_tile, self._seeds, self._targets)
+        path = scratch._get_path(start_point, self._direction)
+        return path, frozenset(), True
+
+    def _repair_block(self, tile):
+        """Repairs the field after tile was blocked, returning the tiles whose pathlength may have changed
+        """
+        field = self._field
+        pathlength = field._pathlength
+        visited = field._visited_validate
+        generation = field._generation
+        blocked = self._blocked
+        changed = set()
+        if visited[tile] != generation:
+            return changed
+        if tile not in self._targets:
+            # Blocked edge tiles keep a pathlength of 0, other blocked tiles are never reached
+            visited[tile] = 0
+
+        # Find the tiles that lost every neighbor they could have been reached from. Candidates are
+        # queued in order of pathlength, so a tile's possible parents are settled before it is checked
+        orphans = set()
+        candidates = [neighbor for neighbor in NEIGHBORS[tile] if visited[neighbor] == generation and pathlength[neighbor] == pathlength[tile] + 1]
+        for candidate in candidates:
+            if candidate in orphans or candidate in self._targets:
+                continue
+            parent_pathlength = pathlength[candidate] - 1
+            supported = False
+            for parent in NEIGHBORS[candidate]:
+                if visited[parent] == generation and pathlength[parent] == parent_pathlength and not blocked[parent] and parent not in orphans:
+                    supported = True
+                    break
+            if supported:
+                continue
+            orphans.add(candidate)
+            for child in NEIGHBORS[candidate]:
+                if visited[child] == generation and pathlength[child] == pathlength[candidate] + 1:
+                    candidates.append(child)
+
+        # Reconnect the orphans to the rest of the field, closest first
+        for orphan in orphans:
+            visited[orphan] = 0
+        frontier = []
+        for orphan in orphans:
+            reachable = [pathlength[neighbor] + 1 for neighbor in NEIGHBORS[orphan] if visited[neighbor] == generation and not blocked[neighbor]]
+            if reachable:
+                heapq.heappush(frontier, (min(reachable), orphan))
+        while frontier:
+            distance, orphan = heapq.heappop(frontier)
+            if visited[orphan] == generation:
+                continue
+            pathlength[orphan] = distance
+            visited[orphan] = generation
+            for neighbor in NEIGHBORS[orphan]:
+                if neighbor in orphans and visited[neighbor] != generation:
+                    heapq.heappush(frontier, (distance + 1, neighbor))
+
+        changed.update(orphans)
+        return changed
+
+    def _repair_unblock(self, tile):
+        """Repairs the field after tile was unblocked, returning the tiles whose pathlength changed
+        """
+        field = self._field
+        pathlength = field._pathlength
+        visited = field._visited_validate
+        generation = field._generation
+        blocked = self._blocked
+        changed = set()
+        if tile not in self._targets:
+            reachable = [pathlength[neighbor] + 1 for neighbor in NEIGHBORS[tile] if visited[neighbor] == generation and not blocked[neighbor]]
+            if not reachable:
+                return changed
+            pathlength[tile] = min(reachable)
+            visited[tile] = generation
+
+        # Every tile that is now closer to the edge is closer through this one
+        current = [tile]
+        for current_location in current:
+            next_pathlength = pathlength[current_location] + 1
+            for neighbor in NEIGHBORS[current_location]:
+                if blocked[neighbor]:
+                    continue
+                if visited[neighbor] != generation or pathlength[neighbor] > next_pathlength:
+                    pathlength[neighbor] = next_pathlength
+                    visited[neighbor] = generation
+                    changed.add(neighbor)
+                    current.append(neighbor)
+        return changed
@@ -0,0 +1,198 @@
+import atexit
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+
+from .game_state import GameState
+from .geometry import TILE_COUNT
+
+"""
+Runs turn evaluation on a pool of worker processes.
+
+Sending a GameState to another process means pickling every GameUnit on the board, which often
+costs more than the evaluation itself. A WorkerPool instead publishes the board once per turn, as
+a flat array of numbers in shared memory. Each worker reads it straight from there and rebuilds its
+own GameState only when a new board is published. After that, only the function to run and its
+argument are sent per task.
+
+Create the pool once, in on_game_start, and keep it for the whole game:
+
+    def on_game_start(self, config):
+        self.pool = gamelib.WorkerPool(config)
+
+    def on_turn(self, turn_state):
+        game_state = gamelib.GameState(self.config, turn_state)
+        self.pool.publish(game_state)
+        estimates = self.pool.map(evaluate_location, deploy_locations)
+
+Creating the pool is cheap, the worker processes are only started by the first map call, or by start.
+Each worker imports gamelib and the algo's main module again, which takes a fraction of a second per
+worker and comes out of the time of the turn that starts them. Call start at the end of a turn that has
+time to spare to pay for it ahead of the turns that need the workers.
+
+The functions given to map must be defined at the top level of a module, so they can be sent to the
+workers, and are called as function(game_state, item) with a fresh fork of the published board.
+"""
+
+# The header holds the board version, the number of structures, the turn number and both players' stats
+_HEADER = 9
+_VERSION, _COUNT, _TURN = 0, 1, 2
+_STATS = 3
+# Each structure is stored as its type index, owner, x, y, health, upgraded and pending removal
+_ROW = 7
+_REMOVE_INDEX = 6
+_UPGRADE_INDEX = 7
+_BUFFER_SIZE = (_HEADER + TILE_COUNT * _ROW) * 8
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(config, memory_name):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    _worker["config"] = config
+    _worker["memory"] = memory
+    _worker["board"] = memory.buf.cast("d")
+    _worker["version"] = None
+    _worker["game_state"] = None
+
+
+def _read_board(config, board):
+    """Rebuilds a turn state, as a parsed dict in the engine's format, from a published board
+    """
+    type_count = len(config["unitInformation"])
+    state = {"turnInfo": [0, int(board[_TURN]), -1]}
+    for player_index, (units_key, stats_key) in enumerate((("p1Units", "p1Stats"), ("p2Units", "p2Stats"))):
+        state[units_key] = [[] for _ in range(type_count)]
+        health, sp, mp = board[_STATS + player_index * 3:_STATS + player_index * 3 + 3]
+        state[stats_key] = [health, sp, mp, 0]
+    for row in range(int(board[_COUNT])):
+        start = _HEADER + row * _ROW
+        type_index, player_index, x, y, health, upgraded, pending_removal = board[start:start + _ROW]
+        units = state["p2Units" if player_index else "p1Units"]
+        location = [int(x), int(y)]
+        units[int(type_index)].append(location + [health, ""])
+        if upgraded:
+            units[_UPGRADE_INDEX].append(location + [0, ""])
+        if pending_removal:
+            units[_REMOVE_INDEX].append(location + [0, ""])
+    return state
+
+
+def shared_board():
+    """In a worker, gets the published board as a flat memoryview of floats, without copying it
+
+    The layout is a header of _HEADER values followed by one row of _ROW values per structure,
+    see WorkerPool.publish. Returns None outside of a worker.
+    """
+    return _worker.get("board")
+
+
+def _run_task(task):
+    version, function, item = task
+    if _worker["version"] != version:
+        board = _worker["board"]
+        if board[_VERSION] != version:
+            raise RuntimeError("The board was published again while tasks for version {} were running".format(version))
+        game_state = GameState(_worker["config"], _read_board(_worker["config"], board))
+        game_state.suppress_warnings(True)
+        _worker["game_state"] = game_state
+        _worker["version"] = version
+    return function(_worker["game_state"].fork(), item)
+
+
+class WorkerPool:
+    """A persistent pool of worker processes that evaluate functions against a board published in shared memory.
+
+    Attributes :
+        * config (JSON): Contains information about the game
+        * processes (int): The number of worker processes
+        * version (int): How many boards have been published
+
+    """
+    def __init__(self, config, processes=None):
+        """Creates the shared board. The workers are started by start, or by the first map call
+
+        Args:
+            config: The game config
+            processes: How many worker processes to start, one per CPU if None
+
+        """
+        self.config = config
+        self.processes = processes or multiprocessing.cpu_count()
+        self.version = 0
+        self._type_index = {unit["shorthand"]: index for index, unit in enumerate(config["unitInformation"])
+                            if "shorthand" in unit}
+        self._memory = shared_memory.SharedMemory(create=True, size=_BUFFER_SIZE)
+        self._board = self._memory.buf.cast("d")
+        self._board[_VERSION] = 0
+        self._pool = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def start(self):
+        """Starts the worker processes, if they are not running yet
+        """
+        if self._closed:
+            raise RuntimeError("The pool was closed")
+        if self._pool is None:
+            # Forking a process that runs the reader and planner threads could copy one of their locks while it is held
+            context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+            self._pool = context.Pool(self.processes, _init_worker, (self.config, self._memory.name))
+
+    def publish(self, game_state):
+        """Writes the structures and resources of a GameState to shared memory, for the tasks of the following map calls
+
+        Args:
+            game_state: The GameState to evaluate against. Mobile units and queued spawns are not published
+        """
+        rows = array("d")
+        count = 0
+        for unit in game_state.game_map._structure_units():
+            rows.extend((self._type_index[unit.unit_type], unit.player_index, unit.x, unit.y, unit.health,
+                         unit.upgraded, unit.pending_removal))
+            count += 1
+        header = array("d", [0, count, game_state.turn_number])
+        for player_index in (0, 1):
+            health = game_state.my_health if player_index == 0 else game_state.enemy_health
+            header.extend((health, game_state.get_resource(game_state.SP, player_index),
+                           game_state.get_resource(game_state.MP, player_index)))
+
+        self.version += 1
+        board = self._board
+        board[:_HEADER] = header
+        board[_HEADER:_HEADER + len(rows)] = rows
+        board[_VERSION] = self.version
+
+    def map(self, function, items, chunksize=None):
+        """Calls function(game_state, item) for every item on the workers, with a fork of the published board
+
+        Args:
+            function: A function defined at the top level of a module. Its results must be picklable
+            items: The arguments to evaluate, such as deploy locations or build candidates
+            chunksize: How many items to send to a worker at once, chosen by the pool if None
+
+        Returns:
+            The results, in the order of the items
+
+        """
+        if self.version == 0:
+            raise RuntimeError("Publish a board before mapping over it")
+        self.start()
+        tasks = [(self.version, function, item) for item in items]
+        return self._pool.map(_run_task, tasks, chunksize)
+
+    def close(self):
+        """Stops the workers and frees the shared memory. Called automatically when the algo exits
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._board.release()
+        self._memory.close()
+        self._memory.unlink()
+        atexit.unregister(self.close)
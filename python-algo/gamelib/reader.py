@@ -0,0 +1,156 @@
+import sys
+import threading
+from collections import deque
+
+from .action_frame import ActionFrame
+from .util import EngineMessage, warn
+
+"""
+Reads messages from the game engine on a background thread.
+
+Reading on its own thread keeps stdin drained while the algo is busy, so a slow on_action_frame
+never backs up the pipe or delays noticing the start of the next turn. Frames waiting to be handled
+are bounded: when too many are waiting, the oldest is merged into the one after it, which keeps its
+events, such as breaches and deaths, but drops its outdated units and stats.
+"""
+
+
+def read_message(line):
+    """Turns a line from the engine into the message type AlgoCore dispatches on
+
+    Args:
+        line: A line read from the engine
+
+    Returns:
+        An ActionFrame for action frames, an EngineMessage for other json messages, or the line itself if it is not json
+
+    """
+    # Action frames are the most common message, so recognise them without decoding the whole frame
+    frame = ActionFrame(line)
+    try:
+        turn_info = frame.turn_info
+    except ValueError:
+        turn_info = None
+    if isinstance(turn_info, list) and turn_info and turn_info[0] == 1:
+        return frame
+    try:
+        # Parse every other message once, handlers and GameState reuse the parsed form
+        return EngineMessage(line)
+    except ValueError:
+        return line
+
+
+class MessageReader:
+    """Reads and classifies engine messages on a background thread, queueing them for the algo.
+
+    Attributes :
+        * stream (file): Where messages are read from, stdin by default
+        * max_frames (int): The most action frames kept waiting before the oldest are merged
+        * frames_coalesced (int): How many frames were merged into later ones so far
+        * frames_dropped (int): How many frames were dropped because no waiting frame could be merged
+
+    """
+    def __init__(self, stream=None, max_frames=8):
+        """Starts reading
+
+        Args:
+            stream: Where to read messages from, sys.stdin if None
+            max_frames: The most action frames kept waiting before the oldest are merged, at least 1
+
+        """
+        self.stream = sys.stdin if stream is None else stream
+        self.max_frames = max(max_frames, 1)
+        self.frames_coalesced = 0
+        self.frames_dropped = 0
+        self._queue = deque()
+        self._waiting_frames = 0
+        self._finished = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="engine-reader", daemon=True)
+        self._thread.start()
+
+    def get(self, timeout=None):
+        """Gets the next message, waiting for one if none is queued
+
+        Args:
+            timeout: How many seconds to wait, None to wait until a message arrives
+
+        Returns:
+            The next message, as returned by read_message, or None if the engine closed the stream or the wait timed out
+
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue or self._finished, timeout=timeout)
+            if not self._queue:
+                return None
+            message = self._queue.popleft()
+            if isinstance(message, ActionFrame):
+                self._waiting_frames -= 1
+            return message
+
+    def _run(self):
+        while True:
+            try:
+                line = self.stream.readline()
+            except (EOFError, ValueError, OSError):
+                line = ""
+            if line == "":
+                with self._condition:
+                    self._finished = True
+                    self._condition.notify_all()
+                return
+            message = read_message(line)
+            with self._condition:
+                self._put(message)
+                self._condition.notify_all()
+
+    def _put(self, message):
+        if isinstance(message, ActionFrame):
+            self._queue.append(message)
+            self._waiting_frames += 1
+            if self._waiting_frames > self.max_frames and not self._merge_frames(1):
+                # Every waiting frame is followed by another message, so none can be merged
+                self._drop_oldest_frame()
+            return
+        if isinstance(message, EngineMessage) and self._waiting_frames > 1:
+            # Handle the rest of the action phase in one call, so that the next message is not kept waiting
+            self._merge_frames(self._waiting_frames - 1)
+        self._queue.append(message)
+
+    def _merge_frames(self, count):
+        """Merges up to count of the oldest waiting frames into the frames right after them
+
+        Returns:
+            The number of frames merged
+
+        """
+        queue = self._queue
+        frames = [index for index, message in enumerate(queue) if isinstance(message, ActionFrame)]
+        merged = set()
+        for position in range(len(frames) - 1):
+            if len(merged) == count:
+                break
+            index = frames[position]
+            # Frames separated by another message belong to different action phases
+            if frames[position + 1] != index + 1:
+                continue
+            try:
+                queue[frames[position + 1]] = queue[frames[position + 1]].merge(queue[index])
+            except ValueError as error:
+                warn("Could not merge action frames: {}", error)
+                continue
+            merged.add(index)
+        if merged:
+            self._queue = deque(message for index, message in enumerate(queue) if index not in merged)
+            self._waiting_frames -= len(merged)
+            self.frames_coalesced += len(merged)
+        return len(merged)
+
+    def _drop_oldest_frame(self):
+        for index, message in enumerate(self._queue):
+            if isinstance(message, ActionFrame):
+                del self._queue[index]
+                self._waiting_frames -= 1
+                self.frames_dropped += 1
+                warn("Too many action frames waiting, dropping the frame of turn {}", message.turn_info)
+                return
@@ -0,0 +1,225 @@
+"""
+Checks a simulator against recorded games.
+
+A replay file holds the game config on its first line, followed by one line per turn and
+per action frame, in the same format the engine sends to algos. For every action phase
+the harness rebuilds the board as it stood when the phase began, hands the units spawned
+on its first frame to the simulator, and compares the simulated frames with the recorded
+ones. Run it from the python-algo folder with
+
+    python -m gamelib.replay ../scripts/test_replay.replay
+"""
+import sys
+import time
+from collections import Counter, namedtuple
+
+from .game_state import GameState
+from .simulator import Simulator
+from .util import json_loads
+
+"""
+One recorded action phase.
+
+    * turn (int): The turn the action phase belongs to
+    * start (dict): The board as it stood before the first frame, as a parsed game state
+    * deploys (list): The mobile units spawned by each player, as lists of (unit_type, x, y)
+    * frames (list): The recorded frames, as parsed json, in order
+"""
+ActionPhase = namedtuple("ActionPhase", ["turn", "start", "deploys", "frames"])
+
+"""
+How closely a simulator followed a replay.
+
+    * phases (int): The number of action phases compared
+    * frames (int): The number of recorded frames compared
+    * position_accuracy (float): The share of mobile unit positions, per frame, that the simulation and the recording agree on
+    * health_error (float): The mean health difference of the units whose positions agree
+    * breaches (list): The recorded number of breaches scored by each player
+    * predicted_breaches (list): The simulated number of breaches scored by each player
+    * frames_per_second (float): How many frames the simulator played per second, without the comparison
+"""
+ReplayReport = namedtuple("ReplayReport", ["phases", "frames", "position_accuracy", "health_error", "breaches",
+                                           "predicted_breaches", "frames_per_second"])
+
+_MOBILE_UNITS = 1
+
+
+def load_replay(path):
+    """Reads a replay file
+
+    Args:
+        path: The path of the .replay file
+
+    Returns:
+        The config, and a list of the ActionPhases in the replay
+
+    """
+    with open(path) as replay:
+        lines = [line for line in replay if line.strip()]
+    config = json_loads(lines[0])
+    frames_by_turn = {}
+    for line in lines[1:]:
+        state = json_loads(line)
+        turn_info = state["turnInfo"]
+        if turn_info[0] == 1:
+            frames_by_turn.setdefault(turn_info[1], []).append(state)
+
+    phases = []
+    for turn in sorted(frames_by_turn):
+        frames = sorted(frames_by_turn[turn], key=lambda frame: frame["turnInfo"][2])
+        phases.append(_read_phase(config, turn, frames))
+    return config, phases
+
+
+def _read_phase(config, turn, frames):
+    """Recovers the board before the first frame of an action phase, and the units deployed on it
+    """
+    unit_information = config["unitInformation"]
+    first = frames[0]
+    events = first.get("events", {})
+    start = {key: first[key] for key in ("turnInfo", "p1Stats", "p2Stats")}
+
+    # The first frame already includes that frame's attacks, so give structures back the damage they took
+    damage = Counter()
+    for location, amount, type_index, unit_id, owner in events.get("damage", []):
+        damage[unit_id] += amount
+    dead = {}
+    for location, type_index, unit_id, owner, removed in events.get("death", []):
+        dead[unit_id] = (location, type_index, owner)
+
+    for owner, units_key in ((1, "p1Units"), (2, "p2Units")):
+        units = []
+        for type_index, unit_list in enumerate(first[units_key]):
+            if unit_information[type_index].get("unitCategory") == _MOBILE_UNITS:
+                units.append([])
+                continue
+            units.append([[x, y, health + damage[unit_id], unit_id] for x, y, health, unit_id in unit_list])
+        for unit_id, (location, type_index, unit_owner) in dead.items():
+            if unit_owner == owner and unit_information[type_index].get("unitCategory") != _MOBILE_UNITS:
+                units[type_index].append([location[0], location[1], damage[unit_id], unit_id])
+        start[units_key] = units
+
+    deploys = ([], [])
+    for location, type_index, unit_id, owner in events.get("spawn", []):
+        if unit_information[type_index].get("unitCategory") == _MOBILE_UNITS:
+            deploys[owner - 1].append((unit_information[type_index]["shorthand"], location[0], location[1]))
+    return ActionPhase(turn, start, deploys, frames)
+
+
+def _recorded_units(config, frame):
+    """The mobile units in a recorded frame, as (unit_type, x, y, health, player_index) tuples
+    """
+    unit_information = config["unitInformation"]
+    units = []
+    for player_index, units_key in enumerate(("p1Units", "p2Units")):
+        for type_index, unit_list in enumerate(frame[units_key]):
+            if unit_information[type_index].get("unitCategory") == _MOBILE_UNITS:
+                shorthand = unit_information[type_index]["shorthand"]
+                units.extend((shorthand, x, y, health, player_index) for x, y, health, unit_id in unit_list)
+    return units
+
+
+def _compare_frame(recorded, predicted):
+    """Counts the unit positions two frames agree on, and the total health difference of those units
+    """
+    def by_position(units):
+        grouped = {}
+        for unit_type, x, y, health, player_index in units:
+            grouped.setdefault((unit_type, x, y, player_index), []).append(health)
+        return grouped
+
+    recorded = by_position(recorded)
+    predicted = by_position(predicted)
+    matched = 0
+    health_error = 0
+    for key, healths in recorded.items():
+        other = predicted.get(key)
+        if other is None:
+            continue
+        # Units on the same tile are interchangeable, so pair them up by health
+        for health, other_health in zip(sorted(healths), sorted(other)):
+            matched += 1
+            health_error += abs(health - other_health)
+    return matched, health_error
+
+
+def check_replay(path, simulator_class=Simulator):
+    """Simulates every action phase of a replay and compares it with the recording
+
+    Args:
+        path: The path of the .replay file
+        simulator_class: The simulator to check. It is built as simulator_class(game_state) and must provide
+            simulate(deploys, enemy_deploys, on_frame) and mobile_units() like Simulator
+
+    Returns:
+        A ReplayReport
+
+    """
+    config, phases = load_replay(path)
+    frames = 0
+    matched = 0
+    positions = 0
+    health_error = 0
+    breaches = [0, 0]
+    predicted_breaches = [0, 0]
+    simulated_frames = 0
+    simulated_time = 0
+
+    for phase in phases:
+        game_state = GameState(config, phase.start)
+        game_state.suppress_warnings(True)
+        predicted = {}
+
+        def record(frame, simulator):
+            predicted[frame] = simulator.mobile_units()
+
+        result = simulator_class(game_state).simulate(phase.deploys[0], phase.deploys[1], record)
+        for player_index in (0, 1):
+            predicted_breaches[player_index] += result.breaches[player_index]
+
+        for frame in phase.frames:
+            index = frame["turnInfo"][2]
+            recorded = _recorded_units(config, frame)
+            simulated = predicted.get(index, [])
+            frame_matched, frame_error = _compare_frame(recorded, simulated)
+            matched += frame_matched
+            health_error += frame_error
+            positions += max(len(recorded), len(simulated))
+            for breach in frame.get("events", {}).get("breach", []):
+                breaches[breach[-1] - 1] += 1
+            frames += 1
+
+        # Time the simulation again without the comparison hook
+        simulator = simulator_class(game_state)
+        started = time.perf_counter()
+        result = simulator.simulate(phase.deploys[0], phase.deploys[1])
+        simulated_time += time.perf_counter() - started
+        simulated_frames += result.frames
+
+    return ReplayReport(
+        phases=len(phases),
+        frames=frames,
+        position_accuracy=matched / positions if positions else 1.0,
+        health_error=health_error / matched if matched else 0.0,
+        breaches=breaches,
+        predicted_breaches=predicted_breaches,
+        frames_per_second=simulated_frames / simulated_time if simulated_time else 0.0)
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python -m gamelib.replay <replay file> [<replay file> ...]")
+        return 1
+    for path in argv[1:]:
+        report = check_replay(path)
+        print(path)
+        print("    {} action phases, {} frames".format(report.phases, report.frames))
+        print("    position accuracy: {:.1%}".format(report.position_accuracy))
+        print("    mean health error: {:.2f}".format(report.health_error))
+        print("    breaches: recorded {}, predicted {}".format(report.breaches, report.predicted_breaches))
+        print("    {:.0f} frames simulated per second".format(report.frames_per_second))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
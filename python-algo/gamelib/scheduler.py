@@ -0,0 +1,209 @@
+import json
+import threading
+import time
+
+from .util import send_command, info, warn, flush_log
+
+"""
+Keeps turns within the engine's time limit.
+
+AlgoCore gives every turn a TurnBudget, available as self.turn_budget during on_turn. Strategies
+can ask it how much time is left, register stages of work that only run while time remains, and
+propose plans as they find them. If on_turn is still running when the deadline arrives, a watchdog
+submits the best plan proposed so far, or an empty turn, and any later submission that turn is dropped.
+"""
+
+_DEFAULT_TIME_LIMIT = 10.0
+
+
+def turn_time_limit(config):
+    """Reads the time an algo has per turn, in seconds, from the game config
+
+    Args:
+        config: The game config
+
+    Returns:
+        The soft time limit per turn in seconds, going over it costs health
+
+    """
+    timing = (config or {}).get("timingAndReplay", {})
+    limit = timing.get("waitTimeBotSoft")
+    return limit / 1000 if limit else _DEFAULT_TIME_LIMIT
+
+
+class TurnBudget:
+    """The time left to play one turn, and the single submission of that turn.
+
+    Attributes :
+        * limit (float): The time allowed for the turn, in seconds
+        * safety_margin (float): How long before the limit the turn is submitted, at the latest
+        * started (float): When the turn started, on the clock's scale
+        * deadline (float): When the turn must be submitted, on the clock's scale
+        * submitted (bool): Whether the turn has been sent to the engine
+        * expired (bool): Whether the watchdog submitted the turn because the deadline was reached
+
+    """
+
+    def __init__(self, limit, safety_margin=1.0, clock=time.monotonic):
+        """Starts the budget for a turn
+
+        Args:
+            limit: The time allowed for the turn, in seconds
+            safety_margin: How long before the limit to submit the turn, at the latest
+            clock: A function returning the current time in seconds
+
+        """
+        self.limit = limit
+        self.safety_margin = safety_margin
+        self.clock = clock
+        self.started = clock()
+        self.deadline = self.started + max(limit - safety_margin, 0)
+        self.submitted = False
+        self.expired = False
+        self._lock = threading.Lock()
+        self._best = None
+        self._best_score = None
+        self._stages = []
+        self._watchdog = None
+
+    def elapsed(self):
+        """Seconds since the turn started
+        """
+        return self.clock() - self.started
+
+    def remaining(self):
+        """Seconds left before the turn must be submitted, never below 0
+        """
+        return max(self.deadline - self.clock(), 0)
+
+    def has_time(self, estimate=0):
+        """Checks whether work expected to take estimate seconds can finish before the deadline
+
+        Args:
+            estimate: How long the work is expected to take, in seconds
+
+        Returns:
+            True if there is time for it and the turn has not been submitted yet
+
+        """
+        return not self.submitted and self.clock() + estimate < self.deadline
+
+    def rounds(self, max_rounds=None):
+        """Yields round numbers for anytime work, as long as another round is expected to fit
+
+        The next round is expected to take as long as the slowest round so far, so a loop like
+        `for _ in budget.rounds(): refine(plan)` stops refining before it runs out of time.
+
+        Args:
+            max_rounds: The most rounds to run, None for no limit
+
+        """
+        slowest = 0
+        round_number = 0
+        while (max_rounds is None or round_number < max_rounds) and self.has_time(slowest):
+            round_started = self.clock()
+            yield round_number
+            slowest = max(slowest, self.clock() - round_started)
+            round_number += 1
+
+    def add_stage(self, work, estimate=0):
+        """Registers a stage of work for run_stages. Register the cheap baseline plan first, then refinements
+
+        Args:
+            work: A function to call with the arguments given to run_stages
+            estimate: How long the stage is expected to take, in seconds. It is skipped if there is not enough time left
+
+        """
+        self._stages.append((work, estimate))
+
+    def run_stages(self, *args):
+        """Runs the registered stages in order, skipping those that would not finish in time
+
+        Returns:
+            The number of stages run
+
+        """
+        run = 0
+        for work, estimate in self._stages:
+            if not self.has_time(estimate):
+                info("Skipping {}, {:.3f}s left in the turn", getattr(work, "__name__", work), self.remaining())
+                continue
+            work(*args)
+            run += 1
+        return run
+
+    def propose(self, game_state, score=None):
+        """Records a plan to submit if the turn is not submitted before the deadline
+
+        Args:
+            game_state: The GameState holding the planned builds and deploys
+            score: How good the plan is. A plan with a score only replaces a best plan with a lower score, a plan
+                without one always replaces the best plan
+
+        Returns:
+            True if the plan became the best plan
+
+        """
+        with self._lock:
+            if score is not None and self._best_score is not None and score <= self._best_score:
+                return False
+            self._best = (json.dumps(game_state._build_stack), json.dumps(game_state._deploy_stack))
+            self._best_score = score
+            return True
+
+    def submit(self, build_string, deploy_string):
+        """Sends the turn to the engine, unless it has already been sent or the deadline was reached
+
+        Returns:
+            True if the turn was sent
+
+        """
+        with self._lock:
+            if self.expired:
+                info("The turn was submitted at the deadline, dropping a late submission")
+                return False
+            if self.submitted:
+                warn("The turn was already submitted, ignoring a later submission")
+                return False
+            send_command(build_string)
+            send_command(deploy_string)
+            self.submitted = True
+            return True
+
+    def submit_best(self):
+        """Submits the best proposed plan, or an empty turn if nothing was proposed
+
+        Returns:
+            True if the turn was sent
+
+        """
+        with self._lock:
+            best = self._best
+        if best is None:
+            best = ("[]", "[]")
+        return self.submit(*best)
+
+    def start_watchdog(self):
+        """Submits the best plan from a background thread when the deadline arrives
+        """
+        def expire():
+            with self._lock:
+                if self.submitted:
+                    return
+                best = self._best or ("[]", "[]")
+                warn("Turn deadline reached after {:.3f}s, submitting the best plan found", self.elapsed())
+                send_command(best[0])
+                send_command(best[1])
+                self.submitted = True
+                self.expired = True
+            # The engine may stop an algo that is still running, so write out what it logged so far
+            flush_log()
+
+        self._watchdog = threading.Timer(self.remaining(), expire)
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def stop_watchdog(self):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
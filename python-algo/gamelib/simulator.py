@@ -0,0 +1,740 @@
+from collections import namedtuple
+
+from .navigation import ShortestPathFinder
+from .game_map import GameMap, _ZOBRIST_KEYS
+from .unit import GameUnit, unit_stats
+from .geometry import ARENA_SIZE, HALF_ARENA, TILE_COUNT, TOP_RIGHT, TOP_LEFT, BOTTOM_LEFT, BOTTOM_RIGHT, EDGES, EDGE_TILES, EDGE_TILE_SETS, tiles_in_range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+The outcome of a simulated action phase. Every per player list is indexed by the acting player, 0 for you 1 for the enemy.
+
+    * frames (int): How many frames the action phase lasted
+    * breaches (list): How many of each player's units reached the enemy edge
+    * breach_damage (list): The health each player took from the enemy, through breaches
+    * structure_damage (list): The damage each player's units dealt to enemy structures
+    * unit_damage (list): The damage each player's units dealt to enemy mobile units
+    * destroyed (list): The structures destroyed, as (unit_type, x, y, player_index) tuples
+"""
+SimulationResult = namedtuple("SimulationResult", ["frames", "breaches", "breach_damage", "structure_damage", "unit_damage", "destroyed"])
+
+"""
+Stats shared by every unit of a kind, a unit type with or without its upgrade. Ranges are
+stored as the flat tile tuples of tiles_in_range lookups, so per unit state stays small.
+"""
+_Kind = namedtuple("_Kind", ["unit_type", "mobile", "damage_f", "damage_i", "attack_range", "shield_range", "shield",
+                             "shield_bonus", "frames_per_move", "breach_damage", "self_destruct_range",
+                             "self_destruct_f", "self_destruct_i", "self_destruct_steps"])
+
+
+def _target_edge(x, y):
+    """The edge a unit spawned at [x, y] heads for, see GameState.get_target_edge"""
+    if x < HALF_ARENA:
+        return TOP_RIGHT if y < HALF_ARENA else BOTTOM_RIGHT
+    return TOP_LEFT if y < HALF_ARENA else BOTTOM_LEFT
+
+
+class Simulator:
+    """Plays out an action phase offline.
+
+    Units are stored column wise: each attribute lives in its own list and a unit is an index into
+    those lists, so a frame is a handful of tight loops over flat lists rather than attribute lookups
+    on GameUnit objects. The tiles each unit stands on are tracked in a per tile list, so targeting,
+    shielding and self destructs only look at the tiles within range.
+
+    Each frame follows the order of the game engine:
+        1. Supports shield friendly mobile units in range, once per support and unit
+        2. Mobile units whose move is due take a step along their path. A unit at the end of its path
+           either breaches, if it is on its target edge, or self destructs
+        3. Every unit with a target attacks it, choosing targets like GameState.get_target
+        4. Units with no health left are removed. If a structure was destroyed, units re-path
+
+    Shield decay and resource gains are not simulated.
+
+    Attributes :
+        * game_state (GameState): The state the simulation starts from
+        * game_map (GameMap): The simulator's own map of the structures still standing
+        * max_frames (int): A safety limit on the length of an action phase
+
+    """
+    def __init__(self, game_state, max_frames=1000):
+        """Reads the structures on the board
+
+        Args:
+            game_state: The GameState to simulate from. It is not modified
+            max_frames: A safety limit on the length of an action phase
+
+        """
+        self.game_state = game_state
+        self.max_frames = max_frames
+        self._config = game_state.config
+        self._hit_radius = game_state.game_map._hit_radius
+        self._kinds = []
+        self._kind_index = {}
+        self._structures = list(game_state.game_map._structure_units())
+        self.game_map = None
+
+    def contains_stationary_unit(self, location):
+        """Checks the simulator's own map, so the pathfinder sees structures being destroyed
+        """
+        x, y = location
+        return self.game_map._is_blocked(x, y)
+
+    def _get_kind(self, unit):
+        """Gets the index of the kind of a GameUnit, adding the kind the first time it is seen
+        """
+        key = (unit.unit_type, unit.upgraded)
+        kind = self._kind_index.get(key)
+        if kind is not None:
+            return kind
+        stats = unit_stats(unit.unit_type, self._config, unit.upgraded)
+        self._kinds.append(_Kind(
+            unit_type=unit.unit_type,
+            mobile=not stats.stationary,
+            damage_f=stats.damage_f,
+            damage_i=stats.damage_i,
+            attack_range=stats.attackRange,
+            shield_range=stats.shieldRange,
+            shield=stats.shieldPerUnit,
+            shield_bonus=stats.shieldBonusPerY,
+            frames_per_move=1 / stats.speed if stats.speed > 0 else 0,
+            breach_damage=stats.breach_damage,
+            self_destruct_range=stats.self_destruct_range,
+            self_destruct_f=stats.self_destruct_f,
+            self_destruct_i=stats.self_destruct_i,
+            self_destruct_steps=stats.self_destruct_steps))
+        kind = len(self._kinds) - 1
+        self._kind_index[key] = kind
+        return kind
+
+    def _load_board(self):
+        """Builds the simulator's map and the structure columns, once per simulator
+        """
+        self.game_map = GameMap(self._config)
+        self.game_map.enable_warnings = False
+        self._pathfinder = ShortestPathFinder()
+        # Paths of flat tile indices, keyed by (layout hash, tile, edge) and shared by every run
+        self._paths = {}
+        self._x = []
+        self._y = []
+        self._health = []
+        self._player = []
+        self._kind = []
+        self._alive = []
+        self._units_on = [[] for _ in range(TILE_COUNT)]
+        # Mobile only columns, unused for structures
+        self._edge = []
+        self._path = []
+        self._path_position = []
+        self._next_move = []
+        self._steps = []
+        self._shielded_by = []
+        self._source = []
+        self._support_units = []
+        for unit in self._structures:
+            self.game_map._place_unit(unit)
+            index = self._add(unit, unit.x, unit.y, unit.health)
+            kind = self._kinds[self._kind[index]]
+            if kind.shield_range > 0 and (kind.shield > 0 or kind.shield_bonus > 0):
+                self._support_units.append(index)
+        # Structures never move, so the structures able to attack a mobile unit on each tile are worked out once.
+        # Only structures covering a tile with a mobile unit on it need to look for a target
+        covering = [[] for _ in range(TILE_COUNT)]
+        self._always_attacking = []
+        for index in range(len(self._x)):
+            kind = self._kinds[self._kind[index]]
+            if kind.damage_f > 0:
+                self._always_attacking.append(index)
+            elif kind.damage_i > 0:
+                for tile in tiles_in_range(self._x[index], self._y[index], kind.attack_range, self._hit_radius):
+                    covering[tile].append(index)
+        self._covering = [tuple(structures) for structures in covering]
+        self._structure_count = len(self._x)
+        self._structure_health = list(self._health)
+        self._structures_on = [list(units) for units in self._units_on]
+
+    def _reset(self):
+        """Restores the board to the game state, dropping the units of the previous run
+        """
+        if self.game_map is None:
+            self._load_board()
+        count = self._structure_count
+        for index in range(count):
+            if not self._alive[index]:
+                self.game_map._place_unit(self._source[index])
+        for column in (self._x, self._y, self._health, self._player, self._kind, self._alive, self._edge,
+                       self._path, self._path_position, self._next_move, self._steps, self._shielded_by, self._source):
+            del column[count:]
+        self._health[:] = self._structure_health
+        self._alive[:] = [True] * count
+        self._units_on = [list(units) for units in self._structures_on]
+        self._mobile_units = []
+
+    def _add(self, unit, x, y, health):
+        """Appends a unit to the columns and returns its index
+        """
+        index = len(self._x)
+        self._x.append(x)
+        self._y.append(y)
+        self._health.append(health)
+        self._player.append(unit.player_index)
+        self._kind.append(self._get_kind(unit))
+        self._alive.append(True)
+        self._edge.append(None)
+        self._path.append(None)
+        self._path_position.append(0)
+        self._next_move.append(0)
+        self._steps.append(0)
+        self._shielded_by.append(None)
+        self._source.append(unit)
+        self._units_on[x * ARENA_SIZE + y].append(index)
+        return index
+
+    def _deploy(self, deploys, player_index):
+        """Adds mobile units from a deploy stack of (unit_type, x, y) entries
+        """
+        for unit_type, x, y in deploys:
+            unit = GameUnit(unit_type, self._config, player_index, None, x, y)
+            if unit.stationary:
+                continue
+            index = self._add(unit, x, y, unit.health)
+            self._edge[index] = _target_edge(x, y)
+            # Like the engine, a unit first moves 1/speed - 1 frames after it spawns, so speed 1 units step on their first frame
+            self._next_move[index] = self._kinds[self._kind[index]].frames_per_move - 1
+            self._shielded_by[index] = set()
+            self._mobile_units.append(index)
+
+    def _repath(self, index):
+        """Finds the path of a mobile unit from where it stands, as a list of flat tile indices
+        """
+        x, y = self._x[index], self._y[index]
+        edge = self._edge[index]
+        key = (self.game_map.layout_hash(), x * ARENA_SIZE + y, edge)
+        path = self._paths.get(key)
+        if path is None:
+            steps = self._pathfinder.navigate_multiple_endpoints([x, y], EDGES[edge], self)
+            path = [step[0] * ARENA_SIZE + step[1] for step in steps]
+            self._paths[key] = path
+        self._path[index] = path
+        self._path_position[index] = 0
+
+    def simulate(self, deploys=None, enemy_deploys=(), on_frame=None):
+        """Plays out an action phase
+
+        Args:
+            deploys: Your mobile units, as a list of (unit_type, x, y). Defaults to the units you spawned this turn
+            enemy_deploys: The mobile units you expect your opponent to deploy, in the same format
+            on_frame: If given, called as on_frame(frame, simulator) at the end of every frame, see mobile_units
+
+        Returns:
+            A SimulationResult
+
+        """
+        if deploys is None:
+            deploys = self.game_state._deploy_stack
+        self._reset()
+        self._deploy(deploys, 0)
+        self._deploy(enemy_deploys, 1)
+        for index in self._mobile_units:
+            self._repath(index)
+
+        self._breaches = [0, 0]
+        self._breach_damage = [0, 0]
+        self._structure_damage = [0, 0]
+        self._unit_damage = [0, 0]
+        self._destroyed = []
+        frame = 0
+        while frame < self.max_frames and any(self._alive[index] for index in self._mobile_units):
+            self._shield()
+            self._move(frame)
+            self._attack()
+            self._remove_dead()
+            if on_frame is not None:
+                on_frame(frame, self)
+            frame += 1
+        return SimulationResult(frame, self._breaches, self._breach_damage, self._structure_damage, self._unit_damage, self._destroyed)
+
+    def mobile_units(self):
+        """Gets the mobile units still on the board in the current run
+
+        Returns:
+            A list of (unit_type, x, y, health, player_index) tuples
+
+        """
+        units = []
+        for index in self._mobile_units:
+            if self._alive[index]:
+                units.append((self._kinds[self._kind[index]].unit_type, self._x[index], self._y[index], self._health[index], self._player[index]))
+        return units
+
+    def simulate_many(self, plans, enemy_deploys=()):
+        """Plays out one action phase per candidate plan against the same board, all of them at once
+
+        The candidates run in lockstep. Every unit attribute is an array indexed by (candidate, unit),
+        so each step of a frame, for each unit, is one array operation over every candidate. Units are
+        still visited in the order simulate visits them, so each result is the one simulate gives.
+        Paths are shared between candidates whose structure layouts are the same. Identical plans are
+        only simulated once. The array operations cost more than simulate for a few plans, and less
+        from around a hundred. Without numpy, the plans are simulated one at a time.
+
+        Args:
+            plans: A list of candidate deploys, each a list of (unit_type, x, y) as taken by simulate
+            enemy_deploys: The mobile units you expect your opponent to deploy, used for every plan
+
+        Returns:
+            A list with the SimulationResult of each plan, in order
+
+        """
+        keys = [tuple(tuple(deploy) for deploy in deploys) for deploys in plans]
+        distinct = list(dict.fromkeys(keys))
+        if numpy is None:
+            results = [self.simulate(list(deploys), enemy_deploys) for deploys in distinct]
+        else:
+            self._reset()
+            results = _Batch(self, distinct, enemy_deploys).run()
+        by_key = dict(zip(distinct, results))
+        return [by_key[key] for key in keys]
+
+    def _shield(self):
+        kinds = self._kinds
+        for support in self._support_units:
+            if not self._alive[support]:
+                continue
+            kind = kinds[self._kind[support]]
+            player = self._player[support]
+            y = self._y[support]
+            rows = y if player == 0 else ARENA_SIZE - 1 - y
+            amount = kind.shield + kind.shield_bonus * rows
+            for tile in tiles_in_range(self._x[support], y, kind.shield_range, self._hit_radius):
+                for index in self._units_on[tile]:
+                    shielded_by = self._shielded_by[index]
+                    if shielded_by is not None and self._player[index] == player and support not in shielded_by:
+                        shielded_by.add(support)
+                        self._health[index] += amount
+
+    def _move(self, frame):
+        kinds = self._kinds
+        for index in self._mobile_units:
+            if not self._alive[index] or frame < self._next_move[index]:
+                continue
+            kind = kinds[self._kind[index]]
+            self._next_move[index] += kind.frames_per_move
+            path = self._path[index]
+            position = self._path_position[index] + 1
+            if position < len(path):
+                old_tile = path[position - 1]
+                tile = path[position]
+                self._units_on[old_tile].remove(index)
+                self._units_on[tile].append(index)
+                self._x[index], self._y[index] = divmod(tile, ARENA_SIZE)
+                self._path_position[index] = position
+                self._steps[index] += 1
+                if position < len(path) - 1:
+                    continue
+            # The unit is at the end of its path
+            player = self._player[index]
+            tile = path[-1]
+            if tile in EDGE_TILE_SETS[self._edge[index]]:
+                self._breaches[player] += 1
+                self._breach_damage[1 - player] += kind.breach_damage
+            elif self._steps[index] >= kind.self_destruct_steps:
+                self._self_destruct(index, kind)
+            self._health[index] = 0
+            self._alive[index] = False
+            self._units_on[tile].remove(index)
+
+    def _self_destruct(self, index, kind):
+        player = self._player[index]
+        for tile in tiles_in_range(self._x[index], self._y[index], kind.self_destruct_range, self._hit_radius):
+            for target in self._units_on[tile]:
+                if self._player[target] == player or self._health[target] <= 0:
+                    continue
+                if self._kinds[self._kind[target]].mobile:
+                    self._health[target] -= kind.self_destruct_i
+                    self._unit_damage[player] += kind.self_destruct_i
+                else:
+                    self._health[target] -= kind.self_destruct_f
+                    self._structure_damage[player] += kind.self_destruct_f
+
+    def _choose_target(self, index, kind):
+        """Chooses a target using the priorities of GameState.get_target.
+        Candidates are compared by a key, the smallest wins and ties go to the first candidate found.
+        """
+        x, y = self._x[index], self._y[index]
+        player = self._player[index]
+        kinds = self._kinds
+        health = self._health
+        best = None
+        best_key = None
+        for tile in tiles_in_range(x, y, kind.attack_range, self._hit_radius):
+            for target in self._units_on[tile]:
+                if self._player[target] == player or health[target] <= 0:
+                    continue
+                mobile = kinds[self._kind[target]].mobile
+                if (mobile and kind.damage_i == 0) or (not mobile and kind.damage_f == 0):
+                    continue
+                tx, ty = divmod(tile, ARENA_SIZE)
+                key = (0 if mobile else 1, (tx - x) ** 2 + (ty - y) ** 2, health[target],
+                       ty if player == 0 else -ty, -abs(HALF_ARENA - 0.5 - tx))
+                if best_key is None or key < best_key:
+                    best = target
+                    best_key = key
+        return best
+
+    def _attack(self):
+        kinds = self._kinds
+        alive = self._alive
+        structures = set(self._always_attacking)
+        mobile_units = []
+        for index in self._mobile_units:
+            if alive[index]:
+                structures.update(self._covering[self._x[index] * ARENA_SIZE + self._y[index]])
+                mobile_units.append(index)
+        # Structures come before mobile units, in index order, like a scan of every unit would
+        for index in sorted(structures) + mobile_units:
+            if not alive[index]:
+                continue
+            kind = kinds[self._kind[index]]
+            if kind.damage_f == 0 and kind.damage_i == 0:
+                continue
+            target = self._choose_target(index, kind)
+            if target is None:
+                continue
+            player = self._player[index]
+            if kinds[self._kind[target]].mobile:
+                self._health[target] -= kind.damage_i
+                self._unit_damage[player] += kind.damage_i
+            else:
+                self._health[target] -= kind.damage_f
+                self._structure_damage[player] += kind.damage_f
+
+    def _remove_dead(self):
+        layout_changed = False
+        for index in range(len(self._x)):
+            if not self._alive[index] or self._health[index] > 0:
+                continue
+            self._alive[index] = False
+            x, y = self._x[index], self._y[index]
+            self._units_on[x * ARENA_SIZE + y].remove(index)
+            kind = self._kinds[self._kind[index]]
+            if not kind.mobile:
+                self.game_map.remove_unit([x, y])
+                self._destroyed.append((kind.unit_type, x, y, self._player[index]))
+                layout_changed = True
+        if layout_changed:
+            for index in self._mobile_units:
+                if self._alive[index]:
+                    self._repath(index)
+
+
+class _Batch:
+    """The state of a lockstep run of simulate_many. Rows are candidates and columns are units.
+
+    Columns are the structures, in the simulator's order, then each candidate's own mobile units,
+    padded to the longest plan, then the enemy's. That is the order simulate adds units in, so
+    looping over the columns visits units in the same order.
+    """
+    def __init__(self, simulator, plans, enemy_deploys):
+        self.simulator = simulator
+        kinds = simulator._kinds
+        structure_count = simulator._structure_count
+        own = [[GameUnit(unit_type, simulator._config, 0, None, x, y) for unit_type, x, y in deploys] for deploys in plans]
+        own = [[unit for unit in units if not unit.stationary] for units in own]
+        enemy = [GameUnit(unit_type, simulator._config, 1, None, x, y) for unit_type, x, y in enemy_deploys]
+        enemy = [unit for unit in enemy if not unit.stationary]
+        own_width = max([len(units) for units in own] + [0])
+        rows = len(plans)
+        columns = structure_count + own_width + len(enemy)
+        self.rows = rows
+        self.structure_count = structure_count
+        self.mobile_start = structure_count
+
+        self.kind = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.tile = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.health = numpy.zeros((rows, columns))
+        self.alive = numpy.zeros((rows, columns), dtype=bool)
+        self.player = numpy.zeros(columns, dtype=numpy.int64)
+        self.edge = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.next_move = numpy.zeros((rows, columns))
+        self.steps = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.path_position = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.path_length = numpy.zeros((rows, columns), dtype=numpy.int64)
+        self.paths = numpy.zeros((rows, columns, 1), dtype=numpy.int64)
+        # Units on a tile are visited in the order they arrived on it, like the per tile lists of simulate
+        self.arrival = numpy.tile(numpy.arange(columns), (rows, 1))
+        self.arrivals = columns
+
+        for index in range(structure_count):
+            self.kind[:, index] = simulator._kind[index]
+            self.tile[:, index] = simulator._x[index] * ARENA_SIZE + simulator._y[index]
+            self.health[:, index] = simulator._structure_health[index]
+            self.player[index] = simulator._player[index]
+        self.alive[:, :structure_count] = True
+        self.player[structure_count + own_width:] = 1
+        for row, units in enumerate(own):
+            for offset, unit in enumerate(units):
+                self._add(row, structure_count + offset, unit)
+            for offset, unit in enumerate(enemy):
+                self._add(row, structure_count + own_width + offset, unit)
+
+        def stat(name, dtype=float):
+            return numpy.array([getattr(kind, name) for kind in kinds], dtype=dtype)
+        self.mobile_kind = stat("mobile", bool)
+        self.damage_f = stat("damage_f")
+        self.damage_i = stat("damage_i")
+        self.attack_range = stat("attack_range")
+        self.frames_per_move = stat("frames_per_move")
+        self.breach_damage = stat("breach_damage")
+        self.self_destruct_range = stat("self_destruct_range")
+        self.self_destruct_f = stat("self_destruct_f")
+        self.self_destruct_i = stat("self_destruct_i")
+        self.self_destruct_steps = stat("self_destruct_steps")
+        self.next_move[:, self.mobile_start:] = self.frames_per_move[self.kind[:, self.mobile_start:]] - 1
+        self.mobile = self.mobile_kind[self.kind] & (numpy.arange(columns) >= structure_count)
+
+        self.edge_masks = numpy.zeros((4, TILE_COUNT), dtype=bool)
+        for edge, tiles in enumerate(EDGE_TILES):
+            self.edge_masks[edge, list(tiles)] = True
+        self.supports = []
+        for index in simulator._support_units:
+            kind = kinds[simulator._kind[index]]
+            player = simulator._player[index]
+            y = simulator._y[index]
+            amount = kind.shield + kind.shield_bonus * (y if player == 0 else ARENA_SIZE - 1 - y)
+            covered = numpy.zeros(TILE_COUNT, dtype=bool)
+            covered[list(tiles_in_range(simulator._x[index], y, kind.shield_range, simulator._hit_radius))] = True
+            self.supports.append((index, player, amount, covered))
+        self.shielded = numpy.zeros((rows, columns, len(self.supports)), dtype=bool)
+        self.attackers = [index for index in range(structure_count)
+                          if kinds[simulator._kind[index]].damage_f > 0 or kinds[simulator._kind[index]].damage_i > 0]
+
+        self.layout_hash = numpy.full(rows, simulator.game_map.layout_hash(), dtype=numpy.uint64)
+        self.destroyed_structures = [set() for _ in range(rows)]
+        # The structures removed from the simulator's map, which is shared by every candidate while pathing
+        self.map_destroyed = set()
+        self.breaches = numpy.zeros((rows, 2), dtype=numpy.int64)
+        self.breach_damage_taken = numpy.zeros((rows, 2))
+        self.structure_damage = numpy.zeros((rows, 2))
+        self.unit_damage = numpy.zeros((rows, 2))
+        self.destroyed = [[] for _ in range(rows)]
+        self.frames = numpy.full(rows, -1, dtype=numpy.int64)
+
+    def _add(self, row, column, unit):
+        self.kind[row, column] = self.simulator._get_kind(unit)
+        self.tile[row, column] = unit.x * ARENA_SIZE + unit.y
+        self.health[row, column] = unit.health
+        self.alive[row, column] = True
+        self.edge[row, column] = _target_edge(unit.x, unit.y)
+
+    def run(self):
+        simulator = self.simulator
+        self._initial_paths()
+        frame = 0
+        while True:
+            running = self.alive[:, self.mobile_start:].any(axis=1) & (frame < simulator.max_frames)
+            self.frames[(self.frames < 0) & ~running] = frame
+            if not running.any():
+                break
+            self._shield(running)
+            self._move(running, frame)
+            self._attack(running)
+            self._remove_dead(running)
+            frame += 1
+        self._sync_map(set())
+        results = []
+        for row in range(self.rows):
+            results.append(SimulationResult(int(self.frames[row]), self.breaches[row].tolist(),
+                                            self.breach_damage_taken[row].tolist(), self.structure_damage[row].tolist(),
+                                            self.unit_damage[row].tolist(), self.destroyed[row]))
+        return results
+
+    def _initial_paths(self):
+        """Finds the paths from every spawn location in one batched query per edge
+        """
+        simulator = self.simulator
+        layout_hash = simulator.game_map.layout_hash()
+        starts_by_edge = {}
+        for row, column in zip(*numpy.nonzero(self.alive[:, self.mobile_start:])):
+            column += self.mobile_start
+            x, y = divmod(int(self.tile[row, column]), ARENA_SIZE)
+            edge = int(self.edge[row, column])
+            if (layout_hash, x * ARENA_SIZE + y, edge) not in simulator._paths and not simulator.game_map._is_blocked(x, y):
+                starts_by_edge.setdefault(edge, {})[(x, y)] = [x, y]
+        for edge, starts in starts_by_edge.items():
+            paths = simulator._pathfinder.navigate_multiple_starts(list(starts.values()), EDGES[edge], simulator)
+            for (x, y), steps in paths.items():
+                if steps is not None:
+                    simulator._paths[(layout_hash, x * ARENA_SIZE + y, edge)] = [step[0] * ARENA_SIZE + step[1] for step in steps]
+        for row, column in zip(*numpy.nonzero(self.alive[:, self.mobile_start:])):
+            self._repath(row, column + self.mobile_start)
+
+    def _sync_map(self, destroyed):
+        """Makes the simulator's map hold the structures still standing for one candidate
+        """
+        simulator = self.simulator
+        for index in self.map_destroyed - destroyed:
+            simulator.game_map._place_unit(simulator._source[index])
+        for index in destroyed - self.map_destroyed:
+            simulator.game_map.remove_unit([simulator._x[index], simulator._y[index]])
+        self.map_destroyed = set(destroyed)
+
+    def _repath(self, row, column):
+        simulator = self.simulator
+        tile = int(self.tile[row, column])
+        edge = int(self.edge[row, column])
+        key = (int(self.layout_hash[row]), tile, edge)
+        path = simulator._paths.get(key)
+        if path is None:
+            self._sync_map(self.destroyed_structures[row])
+            steps = simulator._pathfinder.navigate_multiple_endpoints(list(divmod(tile, ARENA_SIZE)), EDGES[edge], simulator)
+            path = [step[0] * ARENA_SIZE + step[1] for step in steps]
+            simulator._paths[key] = path
+        if len(path) > self.paths.shape[2]:
+            grown = numpy.zeros(self.paths.shape[:2] + (max(len(path), 2 * self.paths.shape[2]),), dtype=numpy.int64)
+            grown[:, :, :self.paths.shape[2]] = self.paths
+            self.paths = grown
+        self.paths[row, column, :len(path)] = path
+        self.path_length[row, column] = len(path)
+        self.path_position[row, column] = 0
+
+    def _shield(self, running):
+        mobile = self.mobile & self.alive & running[:, None]
+        for support, (index, player, amount, covered) in enumerate(self.supports):
+            shielded = self.shielded[:, :, support]
+            receives = (mobile & self.alive[:, index][:, None] & covered[self.tile] & (self.player == player)[None, :]
+                        & ~shielded)
+            self.health[receives] += amount
+            shielded |= receives
+
+    def _move(self, running, frame):
+        for column in range(self.mobile_start, self.alive.shape[1]):
+            rows = numpy.nonzero(running & self.alive[:, column] & (frame >= self.next_move[:, column]))[0]
+            if not len(rows):
+                continue
+            kinds = self.kind[rows, column]
+            self.next_move[rows, column] += self.frames_per_move[kinds]
+            position = self.path_position[rows, column] + 1
+            length = self.path_length[rows, column]
+            moving = position < length
+            moved = rows[moving]
+            if len(moved):
+                self.tile[moved, column] = self.paths[moved, column, position[moving]]
+                self.arrival[moved, column] = self.arrivals
+                self.arrivals += 1
+                self.path_position[moved, column] = position[moving]
+                self.steps[moved, column] += 1
+            at_end = ~moving | (position >= length - 1)
+            player = int(self.player[column])
+            for row, kind in zip(rows[at_end], kinds[at_end]):
+                # The unit is at the end of its path
+                tile = self.tile[row, column]
+                if self.edge_masks[self.edge[row, column], tile]:
+                    self.breaches[row, player] += 1
+                    self.breach_damage_taken[row, 1 - player] += self.breach_damage[kind]
+                elif self.steps[row, column] >= self.self_destruct_steps[kind]:
+                    self._self_destruct(row, column, kind)
+                self.health[row, column] = 0
+                self.alive[row, column] = False
+
+    def _in_range(self, x, y, centers, radius):
+        """Which units are within radius of each row's center tile, as tiles_in_range counts it
+
+        Args:
+            x, y: The positions of the units of the rows, one row per center
+            centers: The center tile of each row
+            radius: The radius around each center
+
+        """
+        cx, cy = numpy.divmod(centers, ARENA_SIZE)
+        dx = x - cx[:, None]
+        dy = y - cy[:, None]
+        reach = numpy.ceil(radius)[:, None]
+        limit = ((radius + self.simulator._hit_radius) ** 2)[:, None]
+        return (numpy.abs(dx) <= reach) & (numpy.abs(dy) <= reach) & (dx * dx + dy * dy < limit), dx, dy
+
+    def _self_destruct(self, row, column, kind):
+        simulator_kind = self.simulator._kinds[kind]
+        player = int(self.player[column])
+        rows = numpy.array([row])
+        x, y = numpy.divmod(self.tile[rows], ARENA_SIZE)
+        in_range, _, _ = self._in_range(x, y, self.tile[rows, column], self.self_destruct_range[[kind]])
+        hit = in_range[0] & self.alive[row] & (self.player != player) & (self.health[row] > 0)
+        # Visit the targets in tile order, then in order of arrival, as simulate does
+        targets = numpy.nonzero(hit)[0]
+        targets = targets[numpy.lexsort((self.arrival[row, targets], self.tile[row, targets]))]
+        for target in targets:
+            if self.mobile_kind[self.kind[row, target]]:
+                self.health[row, target] -= simulator_kind.self_destruct_i
+                self.unit_damage[row, player] += simulator_kind.self_destruct_i
+            else:
+                self.health[row, target] -= simulator_kind.self_destruct_f
+                self.structure_damage[row, player] += simulator_kind.self_destruct_f
+
+    def _attack(self, running):
+        simulator = self.simulator
+        tile_x, tile_y = numpy.divmod(self.tile, ARENA_SIZE)
+        # Like simulate, only structures covering a tile with a mobile unit on it can find a target
+        mobile_tiles = numpy.unique(self.tile[:, self.mobile_start:][self.alive[:, self.mobile_start:] & running[:, None]])
+        structures = set(simulator._always_attacking)
+        for tile in mobile_tiles.tolist():
+            structures.update(simulator._covering[tile])
+        # Structures come before mobile units, in index order, like simulate
+        for column in sorted(structures) + list(range(self.mobile_start, self.alive.shape[1])):
+            rows = numpy.nonzero(running & self.alive[:, column])[0]
+            if not len(rows):
+                continue
+            kinds = self.kind[rows, column]
+            damage_f = self.damage_f[kinds]
+            damage_i = self.damage_i[kinds]
+            armed = (damage_f > 0) | (damage_i > 0)
+            if not armed.all():
+                rows, kinds, damage_f, damage_i = rows[armed], kinds[armed], damage_f[armed], damage_i[armed]
+                if not len(rows):
+                    continue
+            player = int(self.player[column])
+            x, y = tile_x[rows], tile_y[rows]
+            in_range, dx, dy = self._in_range(x, y, self.tile[rows, column], self.attack_range[kinds])
+            target_mobile = self.mobile_kind[self.kind[rows]]
+            valid = (in_range & self.alive[rows] & (self.health[rows] > 0) & (self.player != player)[None, :]
+                     & ~(target_mobile & (damage_i == 0)[:, None]) & ~(~target_mobile & (damage_f == 0)[:, None]))
+            found = valid.any(axis=1)
+            if not found.any():
+                continue
+            if not found.all():
+                valid, rows, x, y, dx, dy, target_mobile = (valid[found], rows[found], x[found], y[found], dx[found],
+                                                             dy[found], target_mobile[found])
+                damage_f, damage_i = damage_f[found], damage_i[found]
+            # The keys of GameState.get_target, smallest first, then tile order and order of arrival for ties
+            keys = (numpy.where(target_mobile, 0, 1), dx * dx + dy * dy, self.health[rows],
+                    y if player == 0 else -y, -numpy.abs(HALF_ARENA - 0.5 - x), self.tile[rows], self.arrival[rows])
+            best = valid
+            for key in keys:
+                values = numpy.where(best, key, numpy.inf)
+                best = values == values.min(axis=1, keepdims=True)
+            targets = best.argmax(axis=1)
+            hits_mobile = target_mobile[numpy.arange(len(rows)), targets]
+            damage = numpy.where(hits_mobile, damage_i, damage_f)
+            self.health[rows, targets] -= damage
+            self.unit_damage[rows, player] += numpy.where(hits_mobile, damage, 0)
+            self.structure_damage[rows, player] += numpy.where(hits_mobile, 0, damage)
+
+    def _remove_dead(self, running):
+        dead = self.alive & (self.health <= 0) & running[:, None]
+        for row in numpy.nonzero(dead.any(axis=1))[0]:
+            layout_changed = False
+            for column in numpy.nonzero(dead[row])[0]:
+                self.alive[row, column] = False
+                if column < self.structure_count:
+                    simulator = self.simulator
+                    kind = simulator._kinds[simulator._kind[column]]
+                    self.destroyed[row].append((kind.unit_type, simulator._x[column], simulator._y[column], simulator._player[column]))
+                    self.destroyed_structures[row].add(column)
+                    self.layout_hash[row] ^= numpy.uint64(_ZOBRIST_KEYS[int(self.tile[row, column])])
+                    layout_changed = True
+            if layout_changed:
+                for column in numpy.nonzero(self.alive[row, self.mobile_start:])[0]:
+                    self._repath(row, column + self.mobile_start)
@@ -0,0 +1,297 @@
+import math
+import threading
+
+from .game_state import GameState
+from .navigation import PathCache, ShortestPathFinder, default_path_cache
+from .unit import unit_stats
+from .util import parse_message, warn
+
+"""
+Plans the next turn in the background while the action phase is still being played.
+
+During the action phase the algo mostly waits for the next frame. A SpeculativePlanner uses that
+time: from the latest frame it predicts the board the next turn will start on, and works on it in a
+background thread, computing paths, threat and shield maps and, through a callback, a candidate plan.
+When the real turn starts, the prediction is checked against the real board and whatever is still
+valid is handed to the turn.
+
+AlgoCore runs a planner when its speculative_planning attribute is True, see AlgoCore.plan_next_turn.
+"""
+
+_MOBILE_UNITS = 1
+_REMOVE_INDEX = 6
+_UPGRADE_INDEX = 7
+# The engine sends resources rounded to one decimal, so predictions made from them can be off by 0.1
+_RESOURCE_TOLERANCE = 0.15
+
+
+def _round_resource(amount):
+    # The engine keeps resources to one decimal, rounding halves up
+    return math.floor(amount * 10 + 0.5 + 1e-9) / 10
+
+
+def predict_next_turn(config, frame):
+    """Predicts the state the next turn starts on, from a frame of the action phase
+
+    Mobile units leave the board, structures marked for removal are removed and refunded, and both
+    players receive their resources for the new turn.
+
+    Args:
+        config: The game config
+        frame: An action frame, as an ActionFrame, a parsed dict or a json string
+
+    Returns:
+        The predicted turn state, as a parsed dict in the engine's format
+
+    """
+    unit_information = config["unitInformation"]
+    resources = config.get("resources", {})
+    # Read only the needed sections of an ActionFrame, without decoding its events
+    sections = None if hasattr(frame, "section") else parse_message(frame)
+
+    def section(key):
+        return frame.section(key) if sections is None else sections.get(key)
+
+    turn_number = section("turnInfo")[1] + 1
+    state = {"turnInfo": [0, turn_number, -1]}
+
+    for units_key, stats_key in (("p1Units", "p1Stats"), ("p2Units", "p2Stats")):
+        frame_units = section(units_key)
+        removed = {(unit[0], unit[1]) for unit in frame_units[_REMOVE_INDEX]}
+        upgraded = {(unit[0], unit[1]) for unit in frame_units[_UPGRADE_INDEX]}
+        units = []
+        refund = 0
+        for type_index, unit_list in enumerate(frame_units):
+            if type_index == _REMOVE_INDEX or unit_information[type_index].get("unitCategory") == _MOBILE_UNITS:
+                units.append([])
+                continue
+            kept = []
+            for unit in unit_list:
+                location = (unit[0], unit[1])
+                if location not in removed:
+                    kept.append(unit)
+                elif type_index != _UPGRADE_INDEX:
+                    stats = unit_stats(unit_information[type_index]["shorthand"], config, location in upgraded)
+                    refund += (stats.cost[0] * unit_information[type_index].get("refundPercentage", 0)
+                               * unit[2] / stats.max_health)
+            units.append(kept)
+        state[units_key] = units
+
+        health, sp, mp, time_taken = section(stats_key)[:4]
+        sp = _round_resource(sp + resources.get("coresPerRound", 0) + refund)
+        interval = resources.get("turnIntervalForBitSchedule", 0)
+        growth = (turn_number // interval) * resources.get("bitGrowthRate", 0) if interval else 0
+        mp = _round_resource(mp * (1 - resources.get("bitDecayPerRound", 0)) + resources.get("bitsPerRound", 0) + growth)
+        if "maxBits" in resources:
+            mp = min(mp, resources["maxBits"])
+        state[stats_key] = [health, sp, mp, time_taken]
+    return state
+
+
+def board_signature(state):
+    """Describes the structure layout of a turn state, so that two states can be compared
+
+    Health is left out, as it changes on almost every frame of the action phase while the paths,
+    threat and shield maps planned on only depend on where the structures are, whose they are and
+    whether they are upgraded.
+
+    Args:
+        state: A turn state, as a parsed dict in the engine's format
+
+    Returns:
+        A hashable value, equal for two states with the same structures in the same places
+
+    """
+    signature = []
+    for owner, units_key in enumerate(("p1Units", "p2Units")):
+        for type_index, unit_list in enumerate(state[units_key]):
+            signature.extend((owner, type_index, unit[0], unit[1]) for unit in unit_list)
+    signature.sort()
+    return tuple(signature)
+
+
+class Speculation:
+    """A plan for the next turn, made in the background on a predicted board.
+
+    Attributes :
+        * prediction (dict): The predicted turn state
+        * game_state (GameState): The GameState of the predicted board, with its paths, threat and shield maps computed
+        * plan: What AlgoCore.plan_next_turn returned for the predicted board, or None
+        * board_matches (bool): Whether the real turn has the predicted structure layout. Set once the turn starts
+        * resources_match (bool): Whether both players have the predicted health and resources. Set once the turn starts
+
+    """
+    def __init__(self, prediction, game_state, plan, path_cache, derived):
+        self.prediction = prediction
+        self.game_state = game_state
+        self.plan = plan
+        self.board_matches = False
+        self.resources_match = False
+        self._signature = board_signature(prediction)
+        self._path_cache = path_cache
+        self._derived = derived
+
+    def validate(self, state):
+        """Compares the prediction with the real turn state, and shares the paths found with the default path cache
+
+        Paths are keyed by the structure layout, so they are shared even if the prediction was wrong.
+
+        Args:
+            state: The real turn state, as a parsed dict
+
+        Returns:
+            True if the board matches the prediction
+
+        """
+        default_path_cache.merge(self._path_cache)
+        self.board_matches = board_signature(state) == self._signature
+        self.resources_match = all(
+            abs(actual - predicted) < _RESOURCE_TOLERANCE
+            for stats_key in ("p1Stats", "p2Stats")
+            for actual, predicted in zip(state[stats_key][:3], self.prediction[stats_key][:3]))
+        return self.board_matches
+
+    def apply(self, game_state):
+        """Gives a GameState of the real turn the threat and shield maps computed on the predicted board
+
+        Args:
+            game_state: The GameState made from the real turn state, before it is changed
+
+        Returns:
+            True if the maps were reused, False if the board did not match the prediction
+
+        """
+        if not self.board_matches:
+            return False
+        revision = game_state.game_map._revision
+        for key, value in self._derived.items():
+            game_state._derived_cache[key] = (revision, value)
+        return True
+
+
+class SpeculativePlanner:
+    """Plans the next turn in a background thread from the frames of the action phase.
+
+    The planner works on the latest frame it was given. It only plans again when a newer frame
+    changes the predicted structures, so it is idle for most of the action phase.
+
+    Attributes :
+        * config (JSON): Contains information about the game
+        * plan_callback (function): Called with the predicted GameState in the background thread, returns a plan
+
+    """
+    def __init__(self, config, plan_callback=None):
+        self.config = config
+        self.plan_callback = plan_callback
+        self._condition = threading.Condition()
+        self._frame = None
+        self._busy = False
+        self._closed = False
+        self._generation = 0
+        # The turn of the last finish, frames of earlier action phases are dropped
+        self._turn = -1
+        self._planned = None
+        self._speculation = None
+        self._thread = threading.Thread(target=self._run, name="speculative-planner", daemon=True)
+        self._thread.start()
+
+    def observe(self, frame):
+        """Gives the planner the latest frame of the action phase. Returns immediately
+
+        Frames of an action phase that already ended with finish are ignored.
+        """
+        turn_info = frame.section("turnInfo") if hasattr(frame, "section") else parse_message(frame)["turnInfo"]
+        with self._condition:
+            if turn_info[1] < self._turn:
+                return
+            self._frame = frame
+            self._condition.notify_all()
+
+    def finish(self, state, wait=0.2):
+        """Ends speculation for the action phase and checks the prediction against the real turn
+
+        Args:
+            state: The real turn state, as a parsed dict
+            wait: How many seconds to wait for planning that is still in progress
+
+        Returns:
+            The validated Speculation, or None if there is none for the latest frame
+
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._busy and self._frame is None, timeout=wait)
+            speculation = self._speculation if not self._busy and self._frame is None else None
+            # Anything still being planned belongs to the finished action phase, and stops at its next step
+            self._generation += 1
+            self._turn = state["turnInfo"][1]
+            self._frame = None
+            self._planned = None
+            self._speculation = None
+        if speculation is not None:
+            speculation.validate(state)
+        return speculation
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._frame is not None or self._closed)
+                if self._closed:
+                    return
+                frame = self._frame
+                self._frame = None
+                generation = self._generation
+                planned = self._planned
+                self._busy = True
+            speculation = None
+            try:
+                prediction = predict_next_turn(self.config, frame)
+                if board_signature(prediction) != planned:
+                    speculation = self._speculate(prediction, generation)
+            except Exception as error:
+                warn("Speculative planning failed: {}", error)
+            with self._condition:
+                if generation == self._generation and speculation is not None:
+                    self._speculation = speculation
+                    self._planned = speculation._signature
+                self._busy = False
+                self._condition.notify_all()
+
+    def _stale(self, generation):
+        """Whether the action phase that planning started in has finished, reading the generation under the lock
+        """
+        with self._condition:
+            return generation != self._generation
+
+    def _speculate(self, prediction, generation):
+        """Builds the predicted GameState and precomputes everything the next turn is likely to need
+
+        Returns:
+            A Speculation, or None if the action phase finished before it was done. Planning stops
+            between steps once it has, so it does not compete with the turn for time
+
+        """
+        game_state = GameState(self.config, prediction)
+        game_state.suppress_warnings(True)
+        # A private cache, as the default one belongs to the main thread until the turn starts
+        path_cache = PathCache()
+        game_state._shortest_path_finder = ShortestPathFinder(path_cache)
+        for player_index in (0, 1):
+            game_state.threat_map(player_index)
+            game_state.shield_map(player_index)
+        if self._stale(generation):
+            return None
+        edge_locations = [location for edge in game_state.game_map.get_edges() for location in edge]
+        game_state.find_paths_to_edges(edge_locations)
+        # Keep the maps of the predicted board, the callback may change it while planning
+        revision = game_state.game_map._revision
+        derived = {key: value for key, (entry_revision, value) in game_state._derived_cache.items()
+                   if entry_revision == revision}
+        if self._stale(generation):
+            return None
+        plan = self.plan_callback(game_state) if self.plan_callback is not None else None
+        return Speculation(prediction, game_state, plan, path_cache, derived)
@@ -0,0 +1,201 @@
+from .game_map import GameMap
+from .unit import GameUnit, unit_stats
+from .geometry import TILE_COUNT
+
+"""
+A storage engine for GameMap that keeps units in a table of parallel columns instead of a grid of GameUnits.
+
+Parsing a game state only appends to the columns, and each tile holds a tuple of row numbers, so
+parsing costs time in proportion to the number of units rather than the size of the grid. Forking
+copies the columns and the list of tiles, and only walks the tiles when rows were left behind by
+removed or replaced units.
+GameUnits are only made, as views onto their rows, when a tile is read with game_map[x, y].
+
+Use it by passing map_class=TableGameMap when creating a GameState.
+"""
+
+
+class UnitTable:
+    """Units stored column wise. Each unit is a row number, and rows are only ever appended.
+    Rows left behind by removed or replaced units are dropped when the table is copied for a fork.
+
+    Attributes :
+        * config (JSON): Contains information about the game
+        * unit_type, player_index, x, y, health, upgraded, pending_removal (list): One entry per row
+
+    """
+    def __init__(self, config):
+        self.config = config
+        self.unit_type = []
+        self.player_index = []
+        self.x = []
+        self.y = []
+        self.health = []
+        self.upgraded = []
+        self.pending_removal = []
+
+    def __len__(self):
+        return len(self.unit_type)
+
+    def add(self, unit_type, player_index, x, y, health, upgraded=False, pending_removal=False):
+        """Appends a unit and returns its row number
+        """
+        if not health:
+            health = unit_stats(unit_type, self.config, upgraded).max_health
+        self.unit_type.append(unit_type)
+        self.player_index.append(player_index)
+        self.x.append(x)
+        self.y.append(y)
+        self.health.append(health)
+        self.upgraded.append(upgraded)
+        self.pending_removal.append(pending_removal)
+        return len(self.unit_type) - 1
+
+    def copy(self, rows=None):
+        """Copies the table
+
+        Args:
+            rows: The rows to keep, in order, or None to keep every row. Kept rows are numbered from 0 in the copy
+
+        """
+        table = UnitTable(self.config)
+        for name in ("unit_type", "player_index", "x", "y", "health", "upgraded", "pending_removal"):
+            column = getattr(self, name)
+            setattr(table, name, list(column) if rows is None else [column[row] for row in rows])
+        return table
+
+
+def _column(name, writable=False):
+    def get(view):
+        return getattr(view._table, name)[view._row]
+
+    def put(view, value):
+        getattr(view._table, name)[view._row] = value
+
+    return property(get, put if writable else None)
+
+
+class UnitView(GameUnit):
+    """A GameUnit whose fields are read from, and health and pending_removal written to, a row of a UnitTable.
+
+    Copying a view gives an ordinary GameUnit, detached from the table. Stats assigned to a view, such as
+    attackRange, are kept on the view rather than in the table.
+    """
+    __slots__ = ("_table", "_row")
+
+    unit_type = _column("unit_type")
+    player_index = _column("player_index")
+    x = _column("x")
+    y = _column("y")
+    health = _column("health", True)
+    upgraded = _column("upgraded")
+    pending_removal = _column("pending_removal", True)
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+        self._overrides = None
+
+    @property
+    def config(self):
+        return self._table.config
+
+    @property
+    def _stats(self):
+        table = self._table
+        row = self._row
+        return unit_stats(table.unit_type[row], table.config, table.upgraded[row])
+
+    def upgrade(self):
+        self._table.upgraded[self._row] = True
+        self._overrides = None
+
+    def __copy__(self):
+        unit = GameUnit(self.unit_type, self.config, self.player_index, self.health, self.x, self.y)
+        if self.upgraded:
+            unit.upgrade()
+        unit.health = self.health
+        unit.pending_removal = self.pending_removal
+        unit._overrides = self._overrides
+        return unit
+
+
+class TableGameMap(GameMap):
+    """A GameMap storing its units in a UnitTable. It behaves like GameMap, see the module description.
+
+    game_map[x, y] returns a list of UnitViews. Changing a view's health or pending_removal changes the table,
+    like changing a GameUnit in a GameMap would, and like those changes it is not undone by rollback.
+    """
+    def _init_storage(self):
+        self._table = UnitTable(self.config)
+        self._tiles = [()] * TILE_COUNT
+        # How many rows the tiles refer to, fewer than the table holds once units are removed or replaced
+        self._live_rows = 0
+        self._views = {}
+        # The list of views last handed out for each tile, with the tile state it was made from
+        self._tile_lists = [None] * TILE_COUNT
+
+    def _units_at(self, x, y):
+        index = x * self.ARENA_SIZE + y
+        rows = self._tiles[index]
+        cached = self._tile_lists[index]
+        if cached is not None and cached[0] is rows:
+            return cached[1]
+        units = [self._view(row) for row in rows]
+        self._tile_lists[index] = (rows, units)
+        return units
+
+    def _read_tile(self, x, y):
+        # Views write to this map's own table, and the list handed out is this map's own
+        return self._units_at(x, y)
+
+    def _view(self, row):
+        view = self._views.get(row)
+        if view is None:
+            view = UnitView(self._table, row)
+            self._views[row] = view
+        return view
+
+    def _tile_state(self, x, y):
+        return self._tiles[x * self.ARENA_SIZE + y]
+
+    def _load_tile(self, x, y, state):
+        index = x * self.ARENA_SIZE + y
+        self._live_rows += len(state) - len(self._tiles[index])
+        self._tiles[index] = state
+
+    def _pack(self, units):
+        rows = []
+        for unit in units:
+            if type(unit) is UnitView and unit._table is self._table:
+                rows.append(unit._row)
+            else:
+                rows.append(self._table.add(unit.unit_type, unit.player_index, unit.x, unit.y, unit.health,
+                                            unit.upgraded, unit.pending_removal))
+        return tuple(rows)
+
+    def _fork_storage(self, child):
+        if self._live_rows == len(self._table):
+            # Every row is still on the board, so the tiles can be shared as they are without walking them
+            child._table = self._table.copy()
+            child._tiles = list(self._tiles)
+        else:
+            # Leave out the rows of removed or replaced units, so they are not copied again by every later fork
+            live = sorted(row for rows in self._tiles for row in rows)
+            child._table = self._table.copy(live)
+            renumbered = {row: new_row for new_row, row in enumerate(live)}
+            child._tiles = [tuple(renumbered[row] for row in rows) if rows else () for rows in self._tiles]
+        child._live_rows = len(child._table)
+        child._views = {}
+        child._tile_lists = [None] * TILE_COUNT
+
+    def _add_parsed_unit(self, unit_type, player_index, health, x, y):
+        row = self._table.add(unit_type, player_index, x, y, health)
+        index = x * self.ARENA_SIZE + y
+        if unit_stats(unit_type, self.config).stationary:
+            self._set_tile_state(x, y, (row,))
+            self._set_structure(index, 1)
+        else:
+            self._set_tile_state(x, y, self._tiles[index] + (row,))
+        self._occupied[index] = 1
+        self._mark_changed()
@@ -1,10 +1,53 @@
 import unittest
+import copy
+import io
 import json
+import os
+import sys
+import time
+from . import game_state as game_state_module
 from .game_state import GameState
-from .unit import GameUnit
+from .unit import GameUnit, unit_stats
+from .navigation import PathCache, PathField
+from .evaluation import PathEvaluator
+from .simulator import Simulator
+from .replay import check_replay
+from .table_map import TableGameMap
+from .algocore import AlgoCore
+from .util import EngineMessage
+from . import util
+from .action_frame import ActionFrame
+from .scheduler import TurnBudget
+from .reader import MessageReader
+from .speculation import SpeculativePlanner, predict_next_turn
+from .parallel import WorkerPool
+
+def _path_and_board(game_state, location):
+    """Runs on the workers of test_worker_pool
+    """
+    path = game_state.find_path_to_edge(location)
+    board = (game_state.game_map.layout_hash(), game_state.get_resources(1))
+    for unit in list(game_state.game_map._structure_units()):
+        game_state.game_map.remove_unit([unit.x, unit.y])
+    return path, board
+
 
 class BasicTests(unittest.TestCase):
 
+    def replay_path(self):
+        """The starter kit's replay, skipping the test if it is not available
+        """
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "test_replay.replay")
+        if not os.path.exists(path):
+            self.skipTest("The starter kit replay is not available")
+        return path
+
+    def replay_lines(self):
+        """The non empty lines of the starter kit's replay, the config first
+        """
+        with open(self.replay_path()) as replay:
+            return [line for line in replay if line.strip()]
+
     def make_turn_0_map(self):
         config = """
             {
@@ -215,6 +258,38 @@ class BasicTests(unittest.TestCase):
         self.assertEqual([("DF", 13, 6)], game._build_stack, "Build queue is wrong!")
         self.assertEqual([("SI", 13, 0), ("SI", 13, 0), ("SI", 13, 0)], game._deploy_stack, "Deploy queue is wrong!")
 
+    def test_unit_stats(self):
+        game = self.make_turn_0_map()
+        turret = GameUnit("DF", game.config, 0, None, 13, 5)
+        other = GameUnit("DF", game.config, 0, None, 14, 5)
+        self.assertEqual(2.5, turret.attackRange)
+        turret.attackRange = 5
+        turret.max_health = 100
+        turret.cost = [9, 0]
+        copied = copy.copy(turret)
+        copied.attackRange = 6
+        self.assertEqual((5, 100, [9, 0]), (turret.attackRange, turret.max_health, turret.cost), "Assigned stats should be kept")
+        self.assertEqual((2.5, [2.0, 0]), (other.attackRange, other.cost), "Assigning a stat should only change that unit")
+        self.assertEqual(6, copied.attackRange)
+        turret.upgrade()
+        self.assertEqual(unit_stats("DF", game.config, True).attackRange, turret.attackRange, "Upgrading should use the upgraded stats")
+
+    def test_spawn_many(self):
+        game = self.make_turn_0_map()
+        savepoint = game.savepoint()
+        commands = [("PI", [13, 0], 1000), ("FF", [13, 3], 3), ("EI", [14, 0]), ("SI", [13, 13], 2),
+                    ("DF", [13, 3]), ("DF", [14, 3])]
+        self.assertEqual([5, 1, 0, 0, 0, 1], game.attempt_spawn_many(commands), "Each command should spawn what it can afford")
+        self.assertEqual([22, 0], game.get_resources(), "Resources should be debited for every unit spawned")
+        self.assertEqual([("FF", 13, 3), ("DF", 14, 3)], game._build_stack, "Build queue is wrong!")
+        self.assertEqual([("PI", 13, 0)] * 5, game._deploy_stack, "Deploy queue is wrong!")
+        self.assertEqual(5, len(game.game_map[13, 0]), "Every spawned unit should be on the map")
+
+        game.rollback(savepoint)
+        self.assertEqual(([25, 5], [], []), (game.get_resources(), game._build_stack, game._deploy_stack))
+        self.assertEqual([], game.game_map[13, 0], "Rolling back should remove the spawned units")
+        self.assertEqual(5, game.attempt_spawn("PI", [[13, 0], [14, 0]], 1000), "attempt_spawn should spawn what it can afford")
+
     def test_trivial_functions(self):
         game = self.make_turn_0_map()
 
@@ -275,3 +350,607 @@ class BasicTests(unittest.TestCase):
         actual = game.project_future_MP(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} MP {} turns from now, got {}".format(expected, turns, actual))
 
+
+    def test_pathing(self):
+        game = self.make_turn_0_map()
+
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0], "Paths should start at the starting location")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "An open board should lead to the edge")
+        for step, next_step in zip(path, path[1:]):
+            self.assertEqual(1, abs(step[0] - next_step[0]) + abs(step[1] - next_step[1]), "Paths should move one tile at a time")
+
+        for x in range(0, 28):
+            if game.game_map.in_arena_bounds([x, 13]):
+                game.game_map.add_unit("FF", [x, 13], 0)
+        blocked_path = game.find_path_to_edge([13, 0])
+        self.assertEqual([26, 12], blocked_path[-1], "A walled off unit should path to its best self destruct location")
+        self.assertTrue(all(not game.contains_stationary_unit(location) for location in blocked_path), "Paths should not go through structures")
+
+    def test_batched_pathing(self):
+        game = self.make_turn_0_map()
+        for x in range(3, 25):
+            game.game_map.add_unit("FF", [x, 13], 0)
+        game.game_map.add_unit("FF", [12, 1], 0)
+
+        starts = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+        paths = game.find_paths_to_edges(starts)
+        self.assertEqual(len(starts), len(paths), "There should be one entry per starting location")
+        self.assertIsNone(paths[(12, 1)], "Blocked starting locations have no path")
+        for start in starts:
+            self.assertEqual(game.find_path_to_edge(start), paths[tuple(start)], "Batched paths should match single paths")
+
+    def test_occupancy_bitmap(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("EI", [13, 0], 0)
+        self.assertFalse(game.contains_stationary_unit([13, 0]), "Mobile units do not block")
+        self.assertFalse(game.can_spawn("FF", [13, 0]), "Structures can not be built on top of mobile units")
+        self.assertTrue(game.can_spawn("EI", [13, 0]), "Mobile units should stack")
+
+        game.game_map.add_unit("FF", [13, 1], 0)
+        self.assertTrue(game.contains_stationary_unit([13, 1]), "Structures should block their tile")
+        game.game_map.remove_unit([13, 1])
+        self.assertFalse(game.contains_stationary_unit([13, 1]), "Removed structures should not block")
+        game.game_map[13, 1] = [GameUnit("DF", game.config, 0, None, 13, 1)]
+        self.assertTrue(game.contains_stationary_unit([13, 1]), "Assigned structures should block their tile")
+        game.game_map[13, 1] = []
+        self.assertTrue(game.can_spawn("FF", [13, 1]), "Cleared tiles should be free")
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        cache = PathCache(max_size=2)
+        game._shortest_path_finder.path_cache = cache
+
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual((0, 1), (cache.hits, cache.misses), "The first query should miss")
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Cached paths should match")
+        self.assertEqual((1, 1), (cache.hits, cache.misses), "The second query should hit")
+
+        empty_hash = game.game_map.layout_hash()
+        game.game_map.add_unit("FF", [13, 5], 0)
+        self.assertNotEqual(empty_hash, game.game_map.layout_hash(), "Structures should change the layout hash")
+        game.find_path_to_edge([13, 0])
+        self.assertEqual(2, cache.misses, "A new layout should miss")
+        game.game_map.remove_unit([13, 5])
+        self.assertEqual(empty_hash, game.game_map.layout_hash(), "Removing the structure should restore the layout hash")
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "The old layout should hit again")
+        self.assertEqual(2, cache.hits, "The old layout should hit again")
+
+        game.find_path_to_edge([14, 0])
+        self.assertEqual(2, len(cache), "The cache should stay within its bounds")
+
+    def test_path_field_repair(self):
+        game = self.make_turn_0_map()
+        end_points = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        starts = [[13, 0], [10, 3], [5, 8]]
+        field = PathField(game, end_points, starts)
+        for start in starts:
+            self.assertEqual(game.find_path_to_edge(start), field.path(start), "Fields should path like the pathfinder")
+
+        path = field.path([13, 0])
+        moved = field.set_blocked(path[3], True)
+        self.assertIn([13, 0], moved, "Blocking a tile on a path should change that path")
+        game.game_map.add_unit("FF", path[3], 0)
+        for start in starts:
+            self.assertEqual(game.find_path_to_edge(start), field.path(start), "Repaired fields should path like the pathfinder")
+
+        field.set_blocked(path[3], False)
+        self.assertEqual(path, field.path([13, 0]), "Unblocking should restore the original path")
+        self.assertEqual([], field.set_blocked(path[3], False), "Unblocking a free tile changes nothing")
+
+    def test_range_stencils(self):
+        game = self.make_turn_0_map()
+        for radius in [0, 1, 1.5, 2.5, 3.5, 4.5]:
+            for location in [[13, 13], [0, 13], [13, 0], [27, 14], [3, 3]]:
+                expected = []
+                for x in range(28):
+                    for y in range(28):
+                        if game.game_map.in_arena_bounds([x, y]) and game.game_map.distance_between_locations(location, [x, y]) < radius + 0.01:
+                            expected.append([x, y])
+                self.assertEqual(expected, game.game_map.get_locations_in_range(location, radius), "Stencils should match a full distance scan")
+
+    def test_threat_map(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("DF", [15, 15], 1)
+        game.game_map[15, 15][0].upgrade()
+        game.game_map._mark_changed()
+        game.game_map.add_unit("DF", [12, 12], 0)
+
+        def check(threat):
+            for x, y in game.game_map:
+                expected = sum(unit.damage_i for unit in game.get_attackers([x, y], 0))
+                self.assertEqual(expected, threat[x][y], "Threat should add up the damage of every attacker")
+            self.assertEqual(0, threat[0][0], "Tiles outside the arena have no threat")
+
+        check(game.threat_map(0))
+        self.assertIs(game.threat_map(0), game.threat_map(0), "Threat maps should be cached until the map changes")
+        game.game_map.remove_unit([13, 14])
+        check(game.threat_map(0))
+
+        numpy = game_state_module.numpy
+        game_state_module.numpy = None
+        try:
+            game.game_map.add_unit("DF", [13, 14], 1)
+            check(game.threat_map(0))
+        finally:
+            game_state_module.numpy = numpy
+
+    def test_shield_map(self):
+        game = self.make_turn_0_map()
+        support = game.config["unitInformation"][1]
+        support.update({"shieldRange": 3.5, "shieldPerUnit": 3, "shieldBonusPerY": 0.5})
+        support["upgrade"].update({"shieldRange": 5, "shieldPerUnit": 4})
+        game.game_map.add_unit("EF", [13, 4], 0)
+        game.game_map.add_unit("EF", [14, 23], 1)
+
+        shield = game.shield_map(0)
+        covered = [list(location) for location in game.game_map.get_locations_in_range([13, 4], 3.5)]
+        for x, y in game.game_map:
+            self.assertEqual(5 if [x, y] in covered else 0, shield[x][y], "Shields should cover the support's range")
+        self.assertEqual(3 + 0.5 * 4, game.shield_map(1)[14][20], "Enemy supports count rows from the top edge")
+
+        game.attempt_upgrade([13, 4])
+        self.assertEqual(6, game.shield_map(0)[13][9], "Upgrading should invalidate the cached shield map")
+
+    def test_path_evaluator(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [16, 5], 1)
+        path = game.find_path_to_edge([13, 0])
+        threat = game.threat_map(0)
+        expected_damage = sum(threat[x][y] for x, y in path[:-1])
+        self.assertGreater(expected_damage, 0, "The test turret should cover the path")
+
+        evaluator = PathEvaluator(game)
+        pings = evaluator.evaluate(path, "PI", 10)
+        self.assertEqual(len(path) - 1, pings.frames, "Speed 1 units spend one frame per tile")
+        self.assertEqual(expected_damage, pings.damage_taken, "Damage taken should add up the threat along the path")
+        self.assertEqual(10 - int(expected_damage // 15), pings.survivors, "Only fully depleted units should die")
+        self.assertGreater(pings.damage_dealt, 0, "Units passing a structure should damage it")
+
+        emps = evaluator.evaluate(path, "EI", 40)
+        self.assertEqual(2 * (len(path) - 1), emps.frames, "Speed 0.5 units spend two frames per tile")
+        self.assertEqual(2 * expected_damage, emps.damage_taken, "Slower units should take damage for longer")
+        self.assertEqual(0, evaluator.evaluate(path, "EI", 1).survivors, "A single weak unit should not survive the turret")
+
+        estimates = evaluator.evaluate_many([[13, 0], [14, 0]], {"PI": 10, "EI": 1})
+        self.assertEqual(pings, estimates[("PI", (13, 0))], "Batched estimates should match single ones")
+        self.assertEqual(4, len(estimates))
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        result = Simulator(game).simulate([("PI", 13, 0)] * 5)
+        self.assertEqual([5, 0], result.breaches, "Unopposed units should all breach")
+        self.assertEqual(5, result.breach_damage[1])
+        self.assertEqual(len(game.find_path_to_edge([13, 0])) - 1, result.frames, "Speed 1 units take a step every frame, starting on the frame they spawn")
+
+        game.game_map.add_unit("DF", [21, 11], 1)
+        game.game_map.add_unit("FF", [22, 11], 1)
+        simulator = Simulator(game)
+        result = simulator.simulate([("PI", 13, 0)])
+        self.assertEqual([0, 0], result.breaches, "A lone unit should die to the turret")
+        self.assertEqual(15, result.unit_damage[1])
+
+        result = simulator.simulate([("PI", 13, 0)] * 10)
+        self.assertEqual([("FF", 22, 11, 1), ("DF", 21, 11, 1)], result.destroyed, "A large group should destroy the structures on its path")
+        self.assertEqual(8, result.breaches[0])
+        self.assertTrue(game.contains_stationary_unit([21, 11]), "Simulating should not change the game state")
+
+    def test_batched_simulation(self):
+        game = self.make_turn_0_map()
+        for location in ([21, 14], [6, 14], [13, 16], [10, 15]):
+            game.game_map.add_unit("DF", location, 1)
+        game.game_map.add_unit("FF", [22, 14], 1)
+        game.game_map.add_unit("EF", [12, 5], 0)
+        plans = ([[("PI", 13, 0)] * count for count in (1, 10, 1)] + [[("EI", 14, 0)] * 3, [("PI", 5, 8), ("SI", 20, 6)]]
+                 + [[("SI", 3, 10)] * 15 + [("PI", 24, 10)] * 5, []])
+        enemy = [("SI", 13, 27), ("PI", 14, 27)]
+        results = Simulator(game).simulate_many(plans, enemy)
+        self.assertEqual([Simulator(game).simulate(plan, enemy) for plan in plans], results, "Batched runs should match single runs")
+        self.assertTrue(any(result.destroyed for result in results), "Some plans should destroy structures and re-path")
+        self.assertIs(results[0], results[2], "Identical plans should only be simulated once")
+
+    def test_replay_fidelity(self):
+        report = check_replay(self.replay_path())
+        self.assertEqual(30, report.phases)
+        self.assertGreater(report.position_accuracy, 0.85, "The simulator should follow the recorded action phases")
+
+    def test_fork(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("DF", [12, 2], 0)
+        threat = game.threat_map(0)
+
+        fork = game.fork()
+        self.assertIs(threat, fork.threat_map(0), "Forks should share cached maps until they change")
+        fork.attempt_spawn("FF", [13, 3])
+        fork.attempt_spawn("PI", [13, 0])
+        fork.attempt_upgrade([12, 2])
+        fork.game_map.remove_unit([13, 14])
+
+        self.assertFalse(game.contains_stationary_unit([13, 3]), "Spawning in a fork should not change the parent")
+        self.assertEqual([], game.game_map[13, 0])
+        self.assertFalse(game.game_map[12, 2][0].upgraded, "Upgrading in a fork should not change the parent's units")
+        self.assertTrue(fork.game_map[12, 2][0].upgraded)
+        self.assertTrue(game.contains_stationary_unit([13, 14]))
+        self.assertEqual([], game._build_stack)
+        self.assertNotEqual(game.get_resource(game.SP), fork.get_resource(game.SP))
+        self.assertIs(threat, game.threat_map(0))
+        self.assertEqual(0, fork.threat_map(0)[13][12], "The fork's threat should follow its own map")
+
+        other = game.fork()
+        other.contains_stationary_unit([13, 14])
+        other.get_attackers([13, 12], 0)
+        self.assertEqual(0, sum(other.game_map._private_tiles), "Read only queries should not copy shared tiles")
+        other.game_map[13, 14][0].health = 1
+        other.game_map[13, 14][0].pending_removal = True
+        other.game_map[14, 0].append("x")
+        self.assertEqual((False, []), (game.game_map[13, 14][0].pending_removal, game.game_map[14, 0]),
+                         "Changing a fork's units directly should not change the parent")
+        self.assertNotEqual(1, game.game_map[13, 14][0].health)
+        game.game_map[12, 2][0].health = 2
+        self.assertNotEqual(2, other.game_map[12, 2][0].health, "Changing the parent's units should not change a fork")
+
+        game.game_map.add_unit("FF", [14, 3], 0)
+        self.assertFalse(fork.contains_stationary_unit([14, 3]), "Changing the parent should not change the fork")
+        self.assertEqual(fork.find_path_to_edge([13, 0])[1:], fork.fork().find_path_to_edge([13, 0])[1:])
+
+    def test_savepoints(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("DF", [12, 2], 0)
+
+        def snapshot():
+            return ([list(game.game_map[location]) for location in game.game_map], bytes(game.game_map._structures),
+                    game.game_map.layout_hash(), game.get_resources(), list(game._build_stack), list(game._deploy_stack))
+
+        threat = game.threat_map(0)
+        before = snapshot()
+        savepoint = game.savepoint()
+        game.attempt_spawn("FF", [[13, 3], [14, 3]])
+        game.attempt_spawn("PI", [13, 0], 2)
+        inner = game.savepoint()
+        after_spawns = snapshot()
+        game.attempt_upgrade([12, 2])
+        game.attempt_remove([13, 3])
+        game.game_map.remove_unit([13, 14])
+        game.game_map[5, 10] = [GameUnit("FF", game.config, 0, None, 5, 10)]
+
+        game.rollback(inner)
+        self.assertEqual(after_spawns, snapshot(), "Rolling back should undo the changes since the savepoint")
+        self.assertFalse(game.game_map[12, 2][0].upgraded)
+        game.rollback(savepoint)
+        self.assertEqual(before, snapshot(), "Rolling back should restore the map, resources and stacks")
+        self.assertIs(threat, game.threat_map(0), "Cached maps of the restored board should be valid again")
+
+        game.attempt_spawn("FF", [13, 3])
+        game.commit()
+        game.rollback(savepoint)
+        self.assertTrue(game.contains_stationary_unit([13, 3]), "Committed changes can not be rolled back")
+
+    def test_table_map(self):
+        lines = self.replay_lines()
+        config = json.loads(lines[0])
+        turn = [line for line in lines if json.loads(line).get("turnInfo", [None])[0] == 0][-1]
+
+        grid = GameState(config, turn)
+        table = GameState(config, turn, TableGameMap)
+        def contents(game):
+            return [[(unit.unit_type, unit.player_index, unit.health, unit.upgraded, unit.pending_removal, unit.x, unit.y)
+                     for unit in game.game_map[location]] for location in game.game_map]
+        self.assertEqual(contents(grid), contents(table), "Both storage engines should hold the same units")
+        self.assertEqual(grid.game_map.layout_hash(), table.game_map.layout_hash())
+        self.assertEqual(grid.find_path_to_edge([13, 0]), table.find_path_to_edge([13, 0]))
+        self.assertEqual(str(grid.threat_map(0)), str(table.threat_map(0)))
+
+        structure = next(table.game_map._structure_units())
+        location = [structure.x, structure.y]
+        fork = table.fork()
+        fork.game_map[location][0].health = 1
+        fork.game_map._upgrade_structure(*location)
+        fork.game_map.remove_unit([13, 0])
+        self.assertNotEqual(1, table.game_map[location][0].health, "Forks should not share rows")
+        self.assertFalse(table.game_map[location][0].upgraded)
+        self.assertTrue(fork.game_map[location][0].upgraded)
+        for _ in range(50):
+            fork.game_map._upgrade_structure(*location)
+        self.assertEqual(sum(len(rows) for rows in fork.game_map._tiles), fork.game_map._live_rows)
+        self.assertLess(fork.game_map._live_rows, len(fork.game_map._table))
+        grandchild = fork.fork()
+        self.assertEqual(contents(fork), contents(grandchild))
+        self.assertEqual(sum(len(rows) for rows in grandchild.game_map._tiles), len(grandchild.game_map._table),
+                         "Forks should only copy the rows of units on the board")
+
+        savepoint = table.savepoint()
+        table.game_map.remove_unit(location)
+        table.game_map.add_unit("PI", [13, 0], 0)
+        table.rollback(savepoint)
+        self.assertEqual(contents(grid), contents(table), "Rolling back should restore the table")
+        self.assertEqual(sum(len(rows) for rows in table.game_map._tiles), table.game_map._live_rows)
+
+    def test_engine_messages(self):
+        lines = self.replay_lines()
+        turn = next(line for line in lines if json.loads(line).get("turnInfo", [None])[0] == 0)
+        frame = next(line for line in lines if json.loads(line).get("turnInfo", [None])[0] == 1)
+
+        received = []
+        class RecordingAlgo(AlgoCore):
+            def on_turn(self, turn_state):
+                received.append(turn_state)
+            def on_action_frame(self, action_frame):
+                received.append(action_frame)
+
+        algo = RecordingAlgo()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO(lines[0] + "not json\n" + turn + frame + '{"turnInfo": [2, 1, 0, 0]}\n')
+        try:
+            algo.start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(json.loads(lines[0]), algo.config)
+        self.assertEqual(2, len(received), "The turn and the action frame should reach their handlers")
+        self.assertTrue(all(isinstance(message, EngineMessage) for message in received))
+        self.assertIsInstance(received[1], ActionFrame)
+        self.assertEqual(json.loads(frame), received[1].data)
+        self.assertEqual(json.loads(frame), json.loads(received[1]), "Messages should still work as strings")
+
+        from_string = GameState(algo.config, turn)
+        from_message = GameState(algo.config, received[0])
+        from_dict = GameState(algo.config, json.loads(turn))
+        for game in (from_message, from_dict):
+            self.assertEqual(from_string.game_map.layout_hash(), game.game_map.layout_hash())
+            self.assertEqual(from_string.get_resources(), game.get_resources())
+
+    def test_action_frame(self):
+        frames = [line for line in self.replay_lines() if json.loads(line).get("turnInfo", [None])[0] == 1]
+
+        for line in frames[::50]:
+            state = json.loads(line)
+            frame = ActionFrame(line)
+            self.assertEqual(state["events"]["breach"], frame.events("breach"))
+            self.assertEqual(state["events"]["death"], frame.events("death"))
+            self.assertIsNone(frame._data, "Reading events should not decode the whole frame")
+            self.assertEqual(state["turnInfo"], frame.turn_info)
+            self.assertEqual(state["p2Units"], frame.p2_units)
+            self.assertEqual(state["p1Stats"], frame.p1_stats)
+            self.assertEqual([], frame.events("unknown"))
+            self.assertEqual(state, frame.data)
+
+        spaced = ActionFrame('{ "events" : { "breach" : [[[1, 12], 1, 3, "7", 2]] }, "turnInfo" : [1, 3, 9] }')
+        self.assertEqual([[[1, 12], 1, 3, "7", 2]], spaced.events("breach"))
+        self.assertEqual([1, 3, 9], spaced.turn_info)
+        self.assertIsNone(spaced.p1_units)
+
+    def test_turn_budget(self):
+        now = [0.0]
+        budget = TurnBudget(10, 1, clock=lambda: now[0])
+        self.assertEqual(9, budget.remaining())
+        self.assertTrue(budget.has_time(8))
+        self.assertFalse(budget.has_time(9.5))
+
+        def slow_round():
+            for round_number in budget.rounds():
+                now[0] += 2
+                yield round_number
+        self.assertEqual([0, 1, 2, 3], list(slow_round()), "Rounds should stop before one would overrun the deadline")
+
+        ran = []
+        budget.add_stage(lambda: ran.append("baseline"))
+        budget.add_stage(lambda: ran.append("refinement"), estimate=5)
+        self.assertEqual(1, budget.run_stages())
+        self.assertEqual(["baseline"], ran, "Stages that do not fit in the time left should be skipped")
+
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [13, 3])
+        self.assertTrue(budget.propose(game, score=2))
+        game.attempt_spawn("DF", [14, 3])
+        self.assertFalse(budget.propose(game, score=1), "A worse plan should not replace the best plan")
+
+        class Algo(AlgoCore):
+            def on_turn(self, turn_state):
+                self.turn_budget.propose(game)
+                time.sleep(0.2)
+                GameState(self.config, turn_state).submit_turn()
+
+        algo = Algo()
+        algo.config = game.config
+        algo.turn_time_limit = 0.05
+        algo.turn_safety_margin = 0
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            algo._play_turn(game.serialized_string)
+            sent = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(2, len(sent), "Only the watchdog's submission should be sent")
+        self.assertEqual(2, len(json.loads(sent[0])), "The watchdog should send the proposed plan")
+        self.assertIsNone(game.turn_budget, "GameStates made outside of a turn should send their turn directly")
+
+        late = TurnBudget(0, 0)
+        other = TurnBudget(10, 0)
+        sys.stdout = io.StringIO()
+        try:
+            late.start_watchdog()
+            late._watchdog.join()
+            turn = GameState(game.config, EngineMessage(game.serialized_string, turn_budget=other))
+            self.assertTrue(late.expired)
+            self.assertFalse(late.submit("[]", "[]"), "Submitting after the deadline should do nothing")
+            turn.submit_turn()
+            self.assertTrue(other.submitted, "A GameState should submit through the budget of its own turn")
+            sent = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(4, len(sent))
+
+    def test_speculative_planning(self):
+        lines = self.replay_lines()
+        messages = [line for line in lines[1:] if json.loads(line)["turnInfo"][1] in (2, 3)]
+
+        speculations = []
+        class PlanningAlgo(AlgoCore):
+            def plan_next_turn(self, game_state):
+                return game_state.turn_number
+            def on_turn(self, turn_state):
+                game_state = GameState(self.config, turn_state)
+                reused = self.speculation is not None and self.speculation.apply(game_state)
+                speculations.append((game_state, self.speculation, reused))
+                game_state.submit_turn()
+
+        algo = PlanningAlgo()
+        algo.speculative_planning = True
+        algo.speculation_wait = 5
+        stdin, stdout = sys.stdin, sys.stdout
+        sys.stdin = io.StringIO(lines[0] + "".join(messages) + '{"turnInfo": [2, 4, 0]}\n')
+        sys.stdout = io.StringIO()
+        try:
+            algo.start()
+        finally:
+            sys.stdin, sys.stdout = stdin, stdout
+
+        self.assertEqual(2, len(speculations))
+        self.assertIsNone(speculations[0][1], "There is nothing to speculate on before the first action phase")
+        game_state, speculation, reused = speculations[1]
+        self.assertEqual(3, speculation.plan, "The plan should be made for the next turn")
+        self.assertTrue(speculation.board_matches)
+        self.assertTrue(speculation.resources_match)
+        self.assertTrue(reused)
+        self.assertIs(speculation.game_state.threat_map(0), game_state.threat_map(0), "The predicted maps should be reused")
+        turn = next(line for line in messages if json.loads(line)["turnInfo"][:2] == [0, 3])
+        fresh = GameState(algo.config, turn)
+        self.assertEqual(str(fresh.threat_map(0)), str(game_state.threat_map(0)))
+        self.assertEqual(str(fresh.shield_map(1)), str(game_state.shield_map(1)))
+
+        planned = []
+        planner = SpeculativePlanner(algo.config, planned.append)
+        try:
+            frame = next(line for line in messages if json.loads(line)["turnInfo"][:2] == [1, 2])
+            self.assertIsNone(planner.finish(json.loads(turn), wait=0))
+            planner.observe(frame)
+            self.assertIsNone(planner._frame, "Frames of a finished action phase should be dropped")
+            self.assertIsNone(planner._speculate(predict_next_turn(algo.config, frame), planner._generation - 1))
+            self.assertEqual([], planned, "Planning for a finished action phase should stop before the callback")
+        finally:
+            planner.close()
+
+    def test_message_reader(self):
+        lines = self.replay_lines()
+
+        def breaches_by_turn(states):
+            counts = {}
+            for state in states:
+                if state["turnInfo"][0] == 1:
+                    turn = state["turnInfo"][1]
+                    counts[turn] = counts.get(turn, 0) + len(state["events"]["breach"])
+            return counts
+
+        turns = [json.loads(line)["turnInfo"] for line in lines[1:] if json.loads(line)["turnInfo"][0] != 1]
+        # Room for one merged frame per action phase, so frames only have to be merged, never dropped
+        reader = MessageReader(io.StringIO("".join(lines)), max_frames=len(turns))
+        # Let everything queue up, as if the algo was busy the whole game
+        reader._thread.join()
+        messages = []
+        while True:
+            message = reader.get(timeout=0)
+            if message is None:
+                break
+            messages.append(message)
+
+        frames = [message for message in messages if isinstance(message, ActionFrame)]
+        self.assertEqual(turns, [message.data["turnInfo"] for message in messages[1:] if not isinstance(message, ActionFrame)],
+                         "Every other message should be kept, in order")
+        self.assertLess(len(frames), 2 * len(turns), "Waiting frames should be merged")
+        self.assertEqual(len(lines) - 1 - len(turns), len(frames) + reader.frames_coalesced)
+        self.assertEqual(0, reader.frames_dropped)
+        expected = breaches_by_turn(json.loads(line) for line in lines[1:])
+        self.assertEqual(expected, breaches_by_turn(frame.data for frame in frames), "Merged frames should keep their events")
+        self.assertEqual(expected, breaches_by_turn(json.loads(frame) for frame in frames), "Merged events should be in the json")
+        self.assertEqual(expected, {turn: count for turn, count in breaches_by_turn(
+            {"turnInfo": frame.turn_info, "events": {"breach": frame.events("breach")}} for frame in frames).items()})
+        last_frame = [line for line in lines[1:] if json.loads(line)["turnInfo"][0] == 1][-1]
+        self.assertEqual(json.loads(last_frame)["p1Units"], frames[-1].p1_units, "Merged frames should keep the latest units")
+
+        # A turn message after every frame leaves no two frames next to each other
+        frame_lines = [line for line in lines[1:] if json.loads(line)["turnInfo"][0] == 1][:6]
+        interleaved = [line for frame_line in frame_lines for line in (frame_line, lines[0])]
+        reader = MessageReader(io.StringIO("".join(interleaved)), max_frames=2)
+        reader._thread.join()
+        queued = list(reader._queue)
+        self.assertEqual(2, sum(isinstance(message, ActionFrame) for message in queued), "Waiting frames should stay within the bound")
+        self.assertEqual(4, reader.frames_dropped)
+        self.assertEqual(6, sum(not isinstance(message, ActionFrame) for message in queued), "Other messages should never be dropped")
+
+    def test_worker_pool(self):
+        lines = self.replay_lines()
+        config = json.loads(lines[0])
+        turns = [line for line in lines[1:] if json.loads(line)["turnInfo"][0] == 0]
+        locations = [[x, 13 - x] for x in range(14)] + [[14 + x, x] for x in range(14)]
+
+        pool = WorkerPool(config, processes=2)
+        try:
+            self.assertIsNone(pool._pool, "Workers should only be started when they are needed")
+            for turn in (turns[5], turns[-1]):
+                game_state = GameState(config, turn)
+                game_state.suppress_warnings(True)
+                pool.publish(game_state)
+                results = pool.map(_path_and_board, locations)
+                expected = [(game_state.find_path_to_edge(location),
+                             (game_state.game_map.layout_hash(), game_state.get_resources(1))) for location in locations]
+                self.assertEqual([result[0] for result in expected], [result[0] for result in results])
+                self.assertEqual([result[1] for result in expected], [result[1] for result in results],
+                                 "Every task should get an unchanged copy of the published board")
+        finally:
+            pool.close()
+
+    def test_buffered_log(self):
+        formatted = []
+        class Recorder:
+            def __format__(self, spec):
+                formatted.append(spec)
+                return "recorded"
+
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            util.flush_log()
+            sys.stderr = io.StringIO()
+            util.set_log_level(util.WARNING)
+            util.set_rate_limit(3)
+            util.info("Not logged {}", Recorder())
+            self.assertEqual([], formatted, "Messages below the log level should never be formatted")
+
+            location = [1, 2]
+            util.warn("Blocked at {}", location)
+            location[0] = 5
+            util.warn("Blocked at {}", Recorder())
+            self.assertEqual([], formatted, "Messages should only be formatted when they are written out")
+            for i in range(10):
+                util.warn("Blocked at {}", i)
+            util.debug_write("Always", "kept")
+            self.assertEqual("", sys.stderr.getvalue(), "Nothing should be written before the log is flushed")
+
+            util.flush_log()
+            self.assertEqual(["Blocked at [1, 2]", "Blocked at recorded", "Blocked at 0", "Always, kept",
+                              "Suppressed 9 more messages like: Blocked at {}"], sys.stderr.getvalue().splitlines())
+            util.warn("Blocked at {}", 3)
+            util.flush_log()
+            self.assertTrue(sys.stderr.getvalue().endswith("Blocked at 3\n"), "Rate limits should reset when flushed")
+
+            sys.stderr = io.StringIO()
+            util.warn("Before the errors")
+            for i in range(5):
+                util.error("Failed {}", i)
+            self.assertEqual(["Before the errors"] + ["Failed {}".format(i) for i in range(5)], sys.stderr.getvalue().splitlines(),
+                             "Errors should be written straight away, and never rate limited")
+
+            sys.stderr = io.StringIO()
+            for i in range(1500):
+                util.debug_write("  line", i)
+            util.flush_log()
+            self.assertEqual(["  line, {}".format(i) for i in range(1500)], sys.stderr.getvalue().splitlines(),
+                             "debug_write output should never be dropped")
+        finally:
+            util.flush_log()
+            sys.stderr = stderr
+            util.set_log_level(util.INFO)
+            util.set_rate_limit(20)
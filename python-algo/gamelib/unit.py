@@ -1,3 +1,6 @@
+from collections import namedtuple
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,9 +12,106 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+"""
+The stats every unit of a type shares, before or after upgrading. See GameUnit for what the first ten fields mean.
+The others are only used to simulate the action phase:
+
+    * breach_damage (float): The health an enemy loses when this unit reaches their edge
+    * self_destruct_range (float): The range of this unit's self destruct
+    * self_destruct_f, self_destruct_i (float): The self destruct damage to structures and to mobile units
+    * self_destruct_steps (int): How many steps the unit must have taken to self destruct
+"""
+UnitStats = namedtuple("UnitStats", ["stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange",
+                                     "max_health", "shieldPerUnit", "shieldBonusPerY", "cost", "breach_damage",
+                                     "self_destruct_range", "self_destruct_f", "self_destruct_i", "self_destruct_steps"])
+
+# Stat tables of the most recently seen configs, keyed by id(config). The config is kept alongside its
+# table so that an id reused by a new config is never mistaken for the old one
+_STAT_TABLES = {}
+_MAX_STAT_TABLES = 8
+
+
+def _build_stat_table(config):
+    table = {}
+    for type_config in config["unitInformation"]:
+        if "shorthand" not in type_config:
+            continue
+        base = UnitStats(
+            stationary=type_config.get("unitCategory") == 0,
+            speed=type_config.get("speed", 0),
+            damage_f=type_config.get("attackDamageTower", 0),
+            damage_i=type_config.get("attackDamageWalker", 0),
+            attackRange=type_config.get("attackRange", 0),
+            shieldRange=type_config.get("shieldRange", 0),
+            max_health=type_config.get("startHealth", 0),
+            shieldPerUnit=type_config.get("shieldPerUnit", 0),
+            shieldBonusPerY=type_config.get("shieldBonusPerY", 0),
+            cost=(type_config.get("cost1", 0), type_config.get("cost2", 0)),
+            breach_damage=type_config.get("playerBreachDamage", 1),
+            self_destruct_range=type_config.get("selfDestructRange", 0),
+            self_destruct_f=type_config.get("selfDestructDamageTower", 0),
+            self_destruct_i=type_config.get("selfDestructDamageWalker", 0),
+            self_destruct_steps=type_config.get("selfDestructStepsRequired", 0))
+        upgrade = type_config.get("upgrade", {})
+        upgraded = base._replace(
+            speed=upgrade.get("speed", base.speed),
+            damage_f=upgrade.get("attackDamageTower", base.damage_f),
+            damage_i=upgrade.get("attackDamageWalker", base.damage_i),
+            attackRange=upgrade.get("attackRange", base.attackRange),
+            shieldRange=upgrade.get("shieldRange", base.shieldRange),
+            max_health=upgrade.get("startHealth", base.max_health),
+            shieldPerUnit=upgrade.get("shieldPerUnit", base.shieldPerUnit),
+            shieldBonusPerY=upgrade.get("shieldBonusPerY", base.shieldBonusPerY),
+            cost=(upgrade.get("cost1", 0) + base.cost[0], upgrade.get("cost2", 0) + base.cost[1]))
+        table[(type_config["shorthand"], False)] = base
+        table[(type_config["shorthand"], True)] = upgraded
+    return table
+
+
+def unit_stats(unit_type, config, upgraded=False):
+    """Gets the stats of a unit type without creating a GameUnit
+
+    Args:
+        unit_type: The type of unit, its shorthand
+        config: The game config
+        upgraded: If True, gets the stats of the upgraded unit
+
+    Returns:
+        A UnitStats
+
+    """
+    entry = _STAT_TABLES.get(id(config))
+    if entry is None or entry[0] is not config:
+        if len(_STAT_TABLES) >= _MAX_STAT_TABLES:
+            del _STAT_TABLES[next(iter(_STAT_TABLES))]
+        entry = (config, _build_stat_table(config))
+        _STAT_TABLES[id(config)] = entry
+    return entry[1][(unit_type, upgraded)]
+
+
+def _stat(name, index):
+    def get(unit):
+        overrides = unit._overrides
+        if overrides is not None and name in overrides:
+            return overrides[name]
+        return unit._stats[index]
+
+    def put(unit, value):
+        # A new dict every time, as copies of a unit share the old one
+        overrides = dict(unit._overrides or {})
+        overrides[name] = value
+        unit._overrides = overrides
+
+    return property(get, put, doc="The {} of this unit, see UnitStats. Assigning it only changes this unit".format(name))
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
+    The stats shared by every unit of a type are looked up in a table built once per config, see
+    unit_stats, so a unit only stores what is particular to it. Assigning one of those stats, such as
+    unit.attackRange, stores the new value on that unit alone. Upgrading a unit clears its assigned stats.
+
     Attributes :
         * unit_type (string): This unit's type
         * config (JSON): Contains information about the game
@@ -28,10 +128,23 @@ class GameUnit:
         * health (float): The current health of this unit
         * cost ([int, int]): The resource costs of this unit first is SP second is MP
         * shieldPerUnit (float): how much shield is given per unit
+        * shieldBonusPerY (float): how much extra shield is given per row the unit is placed away from its owner's edge
         * pending_removal (boolean): If this unit is marked for removal by its owner
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ("unit_type", "config", "player_index", "pending_removal", "upgraded", "x", "y", "health", "_stats", "_overrides")
+
+    stationary = _stat("stationary", 0)
+    speed = _stat("speed", 1)
+    damage_f = _stat("damage_f", 2)
+    damage_i = _stat("damage_i", 3)
+    attackRange = _stat("attackRange", 4)
+    shieldRange = _stat("shieldRange", 5)
+    max_health = _stat("max_health", 6)
+    shieldPerUnit = _stat("shieldPerUnit", 7)
+    shieldBonusPerY = _stat("shieldBonusPerY", 8)
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -43,34 +156,24 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, FACTORY
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self._stats = unit_stats(unit_type, config)
+        self._overrides = None
+        self.health = self._stats.max_health if not health else health
+
+    @property
+    def cost(self):
+        """The resource costs of this unit, [SP, MP]. Includes the upgrade cost once upgraded
+        """
+        overrides = self._overrides
+        if overrides is not None and "cost" in overrides:
+            return overrides["cost"]
+        return list(self._stats.cost)
 
+    cost = cost.setter(_stat("cost", 9).fset)
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self._stats = unit_stats(self.unit_type, self.config, True)
+        self._overrides = None
         self.upgraded = True
 
 
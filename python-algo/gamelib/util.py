@@ -1,4 +1,19 @@
+import atexit
+import json
 import sys
+import threading
+
+# Use a faster json parser when one is installed. They all return the same dicts and lists as json.loads
+try:
+    import orjson as _json_backend
+except ImportError:
+    try:
+        import ujson as _json_backend
+    except ImportError:
+        _json_backend = json
+
+JSON_BACKEND = _json_backend.__name__
+json_loads = _json_backend.loads
 
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
@@ -13,14 +28,52 @@ def get_command():
     except EOFError:
         # Game parent process terminated so exit
         debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+        flush_log()
         exit()
     if ret == "":
         # Happens if parent game process dies, so exit for cleanup, 
         # Don't change or starter-algo process won't exit even though the game has closed
         debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+        flush_log()
         exit()
     return ret
 
+class EngineMessage(str):
+    """A line received from the game engine, parsed once when it is created.
+
+    It is still the original string, so code that calls json.loads on it keeps working,
+    but the parsed message is available without parsing it again.
+
+    Attributes :
+        * data (dict): The parsed message
+        * turn_budget (TurnBudget): The budget of the turn this message starts, set by AlgoCore, or None
+
+    """
+    __slots__ = ("data", "turn_budget")
+
+    def __new__(cls, line, data=None, turn_budget=None):
+        message = super().__new__(cls, line)
+        message.data = json_loads(line) if data is None else data
+        message.turn_budget = turn_budget
+        return message
+
+
+def parse_message(message):
+    """Gets the parsed form of an engine message
+
+    Args:
+        message: An EngineMessage, an already parsed dict, or a json string
+
+    Returns:
+        The message as a dict
+
+    """
+    if isinstance(message, EngineMessage):
+        return message.data
+    if isinstance(message, dict):
+        return message
+    return json_loads(message)
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
@@ -32,10 +85,145 @@ def send_command(cmd):
 def debug_write(*msg):
     """Prints a message to the games debug output
 
+    The message is buffered, and written out with the rest of the log when flush_log is called,
+    which AlgoCore does after every turn and action frame. It is never filtered or rate limited.
+
     Args:
         msg: The message to output
 
     """
-    #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
-    sys.stderr.write(", ".join(map(str, msg)).strip() + "\n")
-    sys.stderr.flush()
+    if _log.add(None, msg, False):
+        flush_log()
+
+
+"""
+Levelled logging. Messages are kept in a buffer, and only formatted and written to stderr when
+flush_log is called, or when the buffer fills up, so that logging costs little while a turn is being computed. Messages below
+the log level are dropped before anything is formatted, and each category, by default the message
+template, is limited to a number of messages per flush. Errors are never rate limited, and are written out straight away
+together with everything buffered before them.
+"""
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+
+class _LogBuffer:
+    """The buffered messages, and the counters used for rate limiting
+
+    Attributes :
+        * level (int): The lowest level of the messages kept
+        * rate_limit (int): The most messages per category between flushes, 0 for no limit
+        * size (int): How many messages are buffered before the buffer asks to be flushed
+
+    """
+    def __init__(self, size=1000):
+        self.level = INFO
+        self.rate_limit = 20
+        self.size = size
+        self._entries = []
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, message, args, category=None):
+        """Buffers a message, unless its category is over the rate limit. A category of False is never limited
+
+        Returns:
+            True if the buffer is full and should be flushed
+
+        """
+        with self._lock:
+            if category is not False:
+                key = message if category is None else category
+                count = self._counts.get(key, 0) + 1
+                self._counts[key] = count
+                if self.rate_limit and count > self.rate_limit:
+                    return False
+            # Locations are often lists that the caller goes on to change, so keep them as they are now
+            self._entries.append((message, tuple(list(arg) if type(arg) is list else arg for arg in args)))
+            return len(self._entries) >= self.size
+
+    def take(self):
+        """Empties the buffer, returning the lines to write
+        """
+        with self._lock:
+            entries = self._entries
+            self._entries = []
+            counts = self._counts
+            self._counts = {}
+
+        lines = [_format(message, args) for message, args in entries]
+        for category, count in counts.items():
+            if self.rate_limit and count > self.rate_limit:
+                lines.append("Suppressed {} more messages like: {}".format(count - self.rate_limit, category))
+        return lines
+
+
+def _format(message, args):
+    if message is None:
+        # Unlike the unbuffered debug_write, only trailing whitespace is stripped. print_map writes each row as
+        # one message now, and the leading spaces of the rows are what line the map up
+        return ", ".join(map(str, args)).rstrip()
+    if not args:
+        return str(message)
+    try:
+        return str(message).format(*args)
+    except (IndexError, KeyError, ValueError):
+        return "{} {}".format(message, args)
+
+
+_log = _LogBuffer()
+
+
+def log(level, message, *args, category=None):
+    """Logs a message, formatted with message.format(*args) only when it is written out
+
+    Args:
+        level: DEBUG, INFO, WARNING or ERROR. Messages below the log level are ignored
+        message: The message, or a format string for args
+        args: Values to format the message with
+        category: What the message is rate limited by, the message itself if None
+
+    """
+    if level < _log.level:
+        return
+    if level >= ERROR:
+        _log.add(message, args, False)
+        flush_log()
+    elif _log.add(message, args, category):
+        flush_log()
+
+def debug(message, *args, category=None):
+    log(DEBUG, message, *args, category=category)
+
+def info(message, *args, category=None):
+    log(INFO, message, *args, category=category)
+
+def warn(message, *args, category=None):
+    log(WARNING, message, *args, category=category)
+
+def error(message, *args, category=None):
+    log(ERROR, message, *args, category=category)
+
+def set_log_level(level):
+    """Sets the lowest level of the messages that are logged, DEBUG, INFO, WARNING or ERROR
+    """
+    _log.level = level
+
+def set_rate_limit(limit):
+    """Sets how many messages of each category are logged between flushes, 0 for no limit
+    """
+    _log.rate_limit = limit
+
+def flush_log():
+    """Writes every buffered message to the games debug output at once
+    """
+    lines = _log.take()
+    if lines:
+        #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
+        sys.stderr.write("\n".join(lines) + "\n")
+        sys.stderr.flush()
+
+
+atexit.register(flush_log)